@@ -3,9 +3,11 @@
 使用 SQLAlchemy 2.0 异步模式
 """
 
+import asyncio
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, List, Tuple
 
+from sqlalchemy import Select, func, select, text
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
@@ -26,6 +28,10 @@ engine = create_async_engine(
     settings.database_url,
     pool_size=settings.database_pool_size,
     max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_pre_ping=settings.database_pool_pre_ping,
+    pool_recycle=settings.database_pool_recycle,
+    query_cache_size=settings.database_query_cache_size,
     echo=settings.debug,
 )
 
@@ -77,12 +83,63 @@ async def get_db_context() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+def build_count_stmt(stmt: Select, single_table: bool = False) -> Select:
+    """
+    根据查询语句构造 COUNT 语句
+    
+    默认用子查询包裹原查询计数。调用方确认查询为单表、无 GROUP BY / DISTINCT 时
+    传入 single_table=True，直接对该表按原 WHERE 条件聚合，省去子查询。
+    """
+    if single_table:
+        count_stmt = select(func.count()).select_from(*stmt.get_final_froms())
+        if stmt.whereclause is not None:
+            count_stmt = count_stmt.where(stmt.whereclause)
+        return count_stmt
+    return select(func.count()).select_from(stmt.order_by(None).subquery())
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    page: int,
+    page_size: int,
+    single_table: bool = False,
+) -> Tuple[List[Any], int]:
+    """
+    分页查询（single_table 含义同 build_count_stmt）
+    
+    Returns:
+        (当前页数据, 总数)
+    
+    Usage:
+        items, total = await paginate(db, select(Item).order_by(Item.id), page, 20)
+    """
+    total = await db.scalar(build_count_stmt(stmt, single_table))
+    result = await db.execute(stmt.offset((page - 1) * page_size).limit(page_size))
+    return list(result.scalars().all()), total or 0
+
+
 async def init_db():
     """初始化数据库，创建所有表"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def warmup_db(connections: int = settings.database_pool_warmup) -> None:
+    """
+    预热连接池：并发建立若干连接后归还池中
+    
+    避免服务刚启动时突发请求同时等待建连
+    """
+    connections = min(connections, settings.database_pool_size)
+    
+    async def _ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    await asyncio.gather(*(_ping() for _ in range(connections)))
+
+
 async def close_db():
     """关闭数据库连接"""
     await engine.dispose()
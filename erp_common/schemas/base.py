@@ -5,6 +5,8 @@
 from datetime import datetime
 from typing import Any, Generic, List, Optional, TypeVar
 
+import orjson
+from fastapi import Response
 from pydantic import BaseModel, Field
 
 T = TypeVar("T")
@@ -41,6 +43,18 @@ class Result(BaseModel, Generic[T]):
         return cls(success=False, code=code, message=message, data=data)
 
 
+def orjson_response(result: Result) -> Response:
+    """
+    直接用 orjson 序列化统一响应（跳过 response_model 的出站校验）
+    
+    用于数据已在返回前校验或由服务端生成的接口；Decimal 按字符串输出，与 Pydantic 默认序列化一致
+    """
+    return Response(
+        content=orjson.dumps(result.model_dump(), default=str),
+        media_type="application/json"
+    )
+
+
 class PageQuery(BaseModel):
     """分页查询基类"""
     
@@ -11,8 +11,29 @@ from pydantic import BaseModel
 
 from erp_common.config import settings
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 密码加密上下文：新哈希使用 Argon2id；历史 bcrypt 哈希仍可验证，并标记为需要更新
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=settings.argon2_time_cost,
+    argon2__memory_cost=settings.argon2_memory_cost,
+    argon2__parallelism=settings.argon2_parallelism,
+)
+
+
+# 密码哈希必须使用的原生后端（argon2pure 等纯 Python 实现慢几个数量级）
+NATIVE_PASSWORD_BACKENDS = {"argon2": "argon2_cffi", "bcrypt": "bcrypt"}
+
+
+def ensure_native_password_backends() -> None:
+    """
+    固定密码哈希使用原生后端（应用启动时调用）
+    
+    原生后端不可用时抛出 MissingBackendError，避免静默回退到纯 Python 实现
+    """
+    for scheme, backend in NATIVE_PASSWORD_BACKENDS.items():
+        pwd_context.handler(scheme).set_backend(backend)
 
 
 class TokenData(BaseModel):
@@ -40,6 +61,11 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """密码哈希的算法或成本与当前配置不一致，需要重新生成"""
+    return pwd_context.needs_update(hashed_password)
+
+
 def create_access_token(
     user_id: int,
     username: str,
@@ -3,10 +3,11 @@ Kafka 消息工具
 异步生产者和消费者封装
 """
 
-import json
+import asyncio
 import logging
-from typing import Any, Awaitable, Callable, Optional
+from typing import Any, Awaitable, Callable, Optional, Union
 
+import orjson
 from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
 
 from erp_common.config import settings
@@ -15,6 +16,29 @@ from erp_common.schemas.events import DomainEvent
 logger = logging.getLogger(__name__)
 
 
+def serialize_value(value: Any) -> bytes:
+    """
+    序列化消息值
+    
+    使用 orjson，Decimal 等类型回退为字符串；已序列化的 bytes 原样发送。
+    datetime/date/time 不使用 orjson 的 ISO 格式（"2024-01-01T12:00:00"），
+    同样交给 str 处理，保持与原 json.dumps(default=str) 一致的
+    "2024-01-01 12:00:00" 格式，避免消费方解析失败
+    """
+    if isinstance(value, bytes):
+        return value
+    return orjson.dumps(value, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def encode_key(key: Optional[Union[str, bytes]]) -> Optional[bytes]:
+    """编码消息键，已编码的 bytes 原样返回"""
+    if not key:
+        return None
+    if isinstance(key, bytes):
+        return key
+    return key.encode("utf-8")
+
+
 class KafkaProducer:
     """
     Kafka 异步生产者
@@ -34,7 +58,10 @@ class KafkaProducer:
         """启动生产者"""
         self._producer = AIOKafkaProducer(
             bootstrap_servers=self.bootstrap_servers,
-            value_serializer=lambda v: json.dumps(v, default=str).encode("utf-8"),
+            value_serializer=serialize_value,
+            linger_ms=settings.kafka_linger_ms,
+            max_batch_size=settings.kafka_batch_size,
+            compression_type=settings.kafka_compression_type,
         )
         await self._producer.start()
         logger.info(f"Kafka producer started: {self.bootstrap_servers}")
@@ -59,20 +86,33 @@ class KafkaProducer:
         await self._producer.send_and_wait(topic, value=event.model_dump())
         logger.debug(f"Event sent to {topic}: {event.event_type}")
     
-    async def send_raw(self, topic: str, key: Optional[str], value: dict) -> None:
+    async def send_raw(self, topic: str, key: Optional[Union[str, bytes]], value: Union[dict, bytes]) -> None:
         """
         发送原始消息
         
         Args:
             topic: Kafka topic
-            key: 消息键
-            value: 消息值
+            key: 消息键（str 或已编码的 bytes）
+            value: 消息值（dict 或已序列化的 JSON bytes）
         """
         if not self._producer:
             raise RuntimeError("Producer not started. Call start() first.")
         
-        key_bytes = key.encode("utf-8") if key else None
+        key_bytes = encode_key(key)
         await self._producer.send_and_wait(topic, key=key_bytes, value=value)
+    
+    async def enqueue_raw(self, topic: str, key: Optional[Union[str, bytes]], value: Union[dict, bytes]) -> asyncio.Future:
+        """
+        将原始消息放入发送缓冲区，不等待投递结果
+        
+        同一批消息会在 linger_ms 内合并为一次请求发送，
+        调用方可 await 返回的 Future 获取投递结果
+        """
+        if not self._producer:
+            raise RuntimeError("Producer not started. Call start() first.")
+        
+        key_bytes = encode_key(key)
+        return await self._producer.send(topic, key=key_bytes, value=value)
 
 
 class KafkaConsumer:
@@ -109,7 +149,7 @@ class KafkaConsumer:
             self.topic,
             bootstrap_servers=self.bootstrap_servers,
             group_id=self.group_id,
-            value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+            value_deserializer=orjson.loads,  # 直接解析 bytes，无需先解码为 str
             auto_offset_reset="earliest",
         )
         await self._consumer.start()
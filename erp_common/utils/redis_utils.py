@@ -54,18 +54,19 @@ class RedisClient:
         self, 
         key: str, 
         value: str, 
-        expire: Optional[int] = None
+        expire: Optional[int] = None,
+        nx: bool = False
     ) -> bool:
-        """设置字符串值"""
+        """设置字符串值（nx=True 时仅在键不存在时设置）"""
         if not self._client:
             raise RuntimeError("Redis not connected. Call connect() first.")
-        return await self._client.set(key, value, ex=expire)
+        return await self._client.set(key, value, ex=expire, nx=nx)
     
-    async def delete(self, key: str) -> int:
-        """删除键"""
+    async def delete(self, *keys: str) -> int:
+        """删除键（支持一次删除多个）"""
         if not self._client:
             raise RuntimeError("Redis not connected. Call connect() first.")
-        return await self._client.delete(key)
+        return await self._client.delete(*keys)
     
     async def exists(self, key: str) -> bool:
         """检查键是否存在"""
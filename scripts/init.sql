@@ -81,6 +81,8 @@ CREATE TABLE IF NOT EXISTS org (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='组织表';
 
 -- 用户表
+-- ngram 全文索引会排除包含停用词的分词（默认停用词有 a、i 等单字母），建索引前关闭停用词
+SET SESSION innodb_ft_enable_stopword = OFF;
 CREATE TABLE IF NOT EXISTS user (
     id BIGINT PRIMARY KEY AUTO_INCREMENT,
     username VARCHAR(50) UNIQUE NOT NULL COMMENT '用户名',
@@ -93,7 +95,8 @@ CREATE TABLE IF NOT EXISTS user (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_org (org_id),
-    INDEX idx_mobile (mobile)
+    INDEX idx_mobile (mobile),
+    FULLTEXT INDEX ft_user_search (username, name, mobile) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='用户表';
 
 -- 角色表
@@ -120,8 +123,10 @@ CREATE TABLE IF NOT EXISTS user_role (
     id BIGINT PRIMARY KEY AUTO_INCREMENT,
     user_id BIGINT NOT NULL,
     role_code VARCHAR(50) NOT NULL,
+    role_id BIGINT COMMENT '角色ID（分配时按 role_code 填充，关联查询走整型主键）',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     UNIQUE KEY uk_user_role (user_id, role_code),
+    INDEX idx_user_role_role_id (role_id),
     FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='用户角色关联表';
 
@@ -145,8 +150,8 @@ CREATE TABLE IF NOT EXISTS audit_log (
     detail TEXT COMMENT '操作详情',
     ip_address VARCHAR(50) COMMENT 'IP地址',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_user (user_id),
-    INDEX idx_action (action),
+    INDEX idx_audit_user_created (user_id, created_at),
+    INDEX idx_audit_action_resource_created (action, resource_type, created_at),
     INDEX idx_resource (resource_type),
     INDEX idx_time (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='操作日志表';
@@ -544,9 +549,9 @@ INSERT INTO user (username, password, name, status) VALUES
 ON DUPLICATE KEY UPDATE name=VALUES(name);
 
 -- 关联管理员角色
-INSERT INTO user_role (user_id, role_code)
-SELECT u.id, 'ADMIN' FROM user u WHERE u.username = 'admin'
-ON DUPLICATE KEY UPDATE role_code=VALUES(role_code);
+INSERT INTO user_role (user_id, role_code, role_id)
+SELECT u.id, r.code, r.id FROM user u JOIN role r ON r.code = 'ADMIN' WHERE u.username = 'admin'
+ON DUPLICATE KEY UPDATE role_id=VALUES(role_id);
 
 -- 插入默认仓库
 INSERT INTO warehouse (code, name, type, status) VALUES
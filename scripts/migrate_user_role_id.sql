@@ -0,0 +1,15 @@
+-- 用户角色关联表增加 role_id（按角色ID关联角色、权限）
+-- 执行方式: docker exec -i erp-mysql-1 mysql -uroot -p<密码> erp < scripts/migrate_user_role_id.sql
+
+SET NAMES utf8mb4;
+
+ALTER TABLE user_role
+    ADD COLUMN role_id BIGINT COMMENT '角色ID（分配时按 role_code 填充，关联查询走整型主键）' AFTER role_code,
+    ADD INDEX idx_user_role_role_id (role_id);
+
+-- 回填已有数据
+UPDATE user_role ur
+JOIN role r ON r.code = ur.role_code
+SET ur.role_id = r.id;
+
+SELECT COUNT(*) AS missing_role_id FROM user_role WHERE role_id IS NULL;
@@ -0,0 +1,10 @@
+-- 用户表增加关键词搜索全文索引（ngram 分词，替代 LIKE '%关键词%' 全表扫描）
+-- 执行方式: docker exec -i erp-mysql-1 mysql -uroot -p<密码> erp < scripts/migrate_user_search_ngram.sql
+
+SET NAMES utf8mb4;
+
+-- ngram 全文索引会排除包含停用词的分词（默认停用词有 a、i 等单字母），建索引前关闭停用词
+SET SESSION innodb_ft_enable_stopword = OFF;
+
+ALTER TABLE user
+    ADD FULLTEXT INDEX ft_user_search (username, name, mobile) WITH PARSER ngram;
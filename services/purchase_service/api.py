@@ -8,20 +8,24 @@ from erp_common.database import get_db
 from erp_common.schemas.base import Result, PageResult
 from erp_common.auth import get_current_user, CurrentUser
 from erp_common.utils.kafka_utils import get_kafka_producer, KafkaProducer
+from erp_common.utils.redis_utils import get_redis_client, RedisClient
 
 from .service import SupplierService, PurchaseOrderService
 from .schemas import (
     SupplierCreate, SupplierUpdate, SupplierResponse,
     PoOrderCreate, PoOrderUpdate, PoOrderResponse,
     PoApproveRequest, PoReceiveRequest, PoReceiveResponse,
-    PoOrderQuery, PoOrderBrief
+    PoOrderQuery, PoPageResult
 )
 
 router = APIRouter(prefix="/purchase", tags=["采购管理"])
 
 
-def get_supplier_service(db: AsyncSession = Depends(get_db)) -> SupplierService:
-    return SupplierService(db)
+def get_supplier_service(
+    db: AsyncSession = Depends(get_db),
+    redis: Optional[RedisClient] = Depends(get_redis_client)
+) -> SupplierService:
+    return SupplierService(db, redis)
 
 
 def get_purchase_order_service(
@@ -50,10 +54,10 @@ async def get_supplier(
     service: SupplierService = Depends(get_supplier_service)
 ):
     """获取供应商详情"""
-    supplier = await service.get_by_id(supplier_id)
+    supplier = await service.get_cached(supplier_id)
     if not supplier:
         return Result.fail(code="NOT_FOUND", message="供应商不存在")
-    return Result.ok(data=SupplierResponse.model_validate(supplier))
+    return Result.ok(data=supplier)
 
 
 @router.put("/supplier/{supplier_id}", response_model=Result[SupplierResponse], summary="更新供应商")
@@ -181,7 +185,7 @@ async def receive_po(
     return Result.ok(data=receive)
 
 
-@router.get("/order/list", response_model=Result[PageResult[PoOrderBrief]], summary="采购订单列表")
+@router.get("/order/list", response_model=Result[PoPageResult], summary="采购订单列表")
 async def list_po_orders(
     po_no: Optional[str] = Query(None, description="采购单号"),
     supplier_id: Optional[int] = Query(None, description="供应商ID"),
@@ -190,6 +194,7 @@ async def list_po_orders(
     end_date: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD"),
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor）"),
     service: PurchaseOrderService = Depends(get_purchase_order_service)
 ):
     """采购订单列表"""
@@ -198,7 +203,8 @@ async def list_po_orders(
         supplier_id=supplier_id,
         status=status,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        cursor=cursor
     )
     
     # 转换日期字符串为 date 对象
@@ -209,10 +215,11 @@ async def list_po_orders(
         from datetime import datetime
         query.end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
     
-    orders, total = await service.query(query)
-    return Result.ok(data=PageResult(
+    orders, total, next_cursor = await service.query(query)
+    return Result.ok(data=PoPageResult(
         items=orders,
         total=total,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        next_cursor=next_cursor
     ))
@@ -103,6 +103,7 @@ class PoOrder(Base):
         Index("idx_po_supplier", "supplier_id"),
         Index("idx_po_status", "status"),
         Index("idx_po_date", "order_date"),
+        Index("idx_po_created_id", "created_at", "id"),
     )
 
 
@@ -6,6 +6,8 @@ from enum import Enum
 
 from pydantic import BaseModel, Field, ConfigDict
 
+from erp_common.schemas.base import PageResult
+
 
 # ============ 枚举类型 ============
 
@@ -233,6 +235,12 @@ class PoOrderQuery(BaseModel):
     end_date: Optional[date] = Field(None, description="结束日期")
     page: int = Field(default=1, ge=1, description="页码")
     page_size: int = Field(default=20, ge=1, le=100, description="每页数量")
+    cursor: Optional[str] = Field(None, description="游标（上一页返回的 next_cursor），传入时忽略 page")
+
+
+class PoPageResult(PageResult[PoOrderBrief]):
+    """采购订单分页结果（支持游标分页）"""
+    next_cursor: Optional[str] = Field(None, description="下一页游标（游标分页时返回，无更多数据为空）")
 
 
 # ============ 事件 Schema ============
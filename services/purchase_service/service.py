@@ -1,17 +1,22 @@
 """采购中心 - 业务服务层"""
+import base64
+import logging
 import uuid
 from datetime import datetime, date
 from decimal import Decimal
 from typing import List, Optional, Tuple
 
 import httpx
-from sqlalchemy import select, update, and_, func
+from pydantic import TypeAdapter
+from sqlalchemy import select, update, and_, or_, exists, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from erp_common.config import settings
+from erp_common.database import build_count_stmt, paginate
 from erp_common.exceptions import BusinessException
 from erp_common.utils.kafka_utils import KafkaProducer
+from erp_common.utils.redis_utils import RedisClient
 
 from .models import Supplier, PoOrder, PoDetail, PoReceive, PoReceiveDetail
 from .schemas import (
@@ -22,6 +27,9 @@ from .schemas import (
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 def generate_po_no() -> str:
     """生成采购单号"""
     return f"PO{datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:6].upper()}"
@@ -32,11 +40,40 @@ def generate_receive_no() -> str:
     return f"RV{datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:6].upper()}"
 
 
+def encode_po_cursor(created_at: datetime, po_id: int) -> str:
+    """将 (created_at, id) 编码为列表游标"""
+    raw = f"{created_at.isoformat()}|{po_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_po_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析列表游标为 (created_at, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, po_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(po_id)
+    except ValueError:
+        raise BusinessException(code="INVALID_CURSOR", message="无效的分页游标")
+
+
+# 采购订单列表批量校验器（模块加载时构建一次）
+_po_brief_list_adapter = TypeAdapter(List[PoOrderBrief])
+
+# 供应商缓存过期时间（秒）
+SUPPLIER_CACHE_TTL = 300
+
+
+def supplier_cache_key(supplier_id: int) -> str:
+    """供应商缓存键"""
+    return f"supplier:{supplier_id}"
+
+
 class SupplierService:
     """供应商服务"""
     
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, redis: Optional[RedisClient] = None):
         self.db = db
+        self.redis = redis
     
     async def create(self, data: SupplierCreate) -> Supplier:
         """创建供应商"""
@@ -51,6 +88,7 @@ class SupplierService:
         self.db.add(supplier)
         await self.db.commit()
         await self.db.refresh(supplier)
+        await self._invalidate_cache(supplier.id)
         return supplier
     
     async def get_by_id(self, supplier_id: int) -> Optional[Supplier]:
@@ -60,6 +98,33 @@ class SupplierService:
         )
         return result.scalar_one_or_none()
     
+    async def get_cached(self, supplier_id: int) -> Optional[SupplierResponse]:
+        """根据ID获取供应商（优先读取 Redis 缓存，Redis 不可用时直接查库）"""
+        if self.redis:
+            try:
+                cached = await self.redis.get_json(supplier_cache_key(supplier_id))
+            except Exception as e:
+                logger.warning(f"Failed to read supplier cache: {e}")
+                cached = None
+            if cached:
+                return SupplierResponse.model_validate(cached)
+        
+        supplier = await self.get_by_id(supplier_id)
+        if not supplier:
+            return None
+        
+        response = SupplierResponse.model_validate(supplier)
+        if self.redis:
+            try:
+                await self.redis.set_json(
+                    supplier_cache_key(supplier_id),
+                    response.model_dump(mode="json"),
+                    expire=SUPPLIER_CACHE_TTL
+                )
+            except Exception as e:
+                logger.warning(f"Failed to write supplier cache: {e}")
+        return response
+    
     async def update(self, supplier_id: int, data: SupplierUpdate) -> Supplier:
         """更新供应商"""
         supplier = await self.get_by_id(supplier_id)
@@ -72,8 +137,18 @@ class SupplierService:
         
         await self.db.commit()
         await self.db.refresh(supplier)
+        await self._invalidate_cache(supplier_id)
         return supplier
     
+    async def _invalidate_cache(self, supplier_id: int):
+        """清除供应商缓存（事务提交后调用，失败只记录日志）"""
+        if not self.redis:
+            return
+        try:
+            await self.redis.delete(supplier_cache_key(supplier_id))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate supplier cache: {e}")
+    
     async def list_suppliers(self, status: Optional[str] = None, page: int = 1, page_size: int = 20) -> Tuple[List[Supplier], int]:
         """供应商列表"""
         stmt = select(Supplier)
@@ -81,16 +156,8 @@ class SupplierService:
         if status:
             stmt = stmt.where(Supplier.status == status)
         
-        # 总数
-        count_stmt = select(func.count()).select_from(stmt.subquery())
-        total = await self.db.scalar(count_stmt)
-        
-        # 分页
         stmt = stmt.order_by(Supplier.created_at.desc())
-        stmt = stmt.offset((page - 1) * page_size).limit(page_size)
-        
-        result = await self.db.execute(stmt)
-        return list(result.scalars().all()), total or 0
+        return await paginate(self.db, stmt, page, page_size, single_table=True)
 
 
 class PurchaseOrderService:
@@ -119,18 +186,16 @@ class PurchaseOrderService:
         self.db.add(order)
         await self.db.flush()
         
+        # 计算明细金额（一次性批量计算，避免逐行累加）
+        amounts = [item.qty * item.unit_price for item in data.details]
+        tax_amounts = [
+            amount * item.tax_rate / 100
+            for item, amount in zip(data.details, amounts)
+        ]
+        
         # 创建订单明细
-        total_qty = Decimal("0")
-        total_amount = Decimal("0")
-        total_tax = Decimal("0")
-        
-        for idx, item in enumerate(data.details, start=1):
-            # 计算金额
-            amount = item.qty * item.unit_price
-            tax_amount = amount * item.tax_rate / 100
-            line_total = amount + tax_amount
-            
-            detail = PoDetail(
+        self.db.add_all([
+            PoDetail(
                 po_id=order.id,
                 sku_id=item.sku_id,
                 sku_name=item.sku_name,
@@ -139,26 +204,50 @@ class PurchaseOrderService:
                 tax_rate=item.tax_rate,
                 amount=amount,
                 tax_amount=tax_amount,
-                total_amount=line_total,
+                total_amount=amount + tax_amount,
                 line_no=idx,
                 remark=item.remark
             )
-            self.db.add(detail)
-            
-            total_qty += item.qty
-            total_amount += amount
-            total_tax += tax_amount
+            for idx, (item, amount, tax_amount) in enumerate(
+                zip(data.details, amounts, tax_amounts), start=1
+            )
+        ])
         
-        # 更新订单汇总
-        order.total_qty = total_qty
-        order.total_amount = total_amount
-        order.tax_amount = total_tax
-        order.payable_amount = total_amount + total_tax
+        await self.db.flush()
+        
+        # 更新订单汇总：由数据库按已落库（已按列精度舍入）的明细一次聚合，
+        # 保证汇总与明细合计一致
+        await self._update_totals(order.id)
         
         await self.db.commit()
         await self.db.refresh(order)
         return order
     
+    async def _update_totals(self, po_id: int):
+        """按明细汇总订单数量、金额、税额和应付金额（单条 UPDATE）"""
+        totals = (
+            select(
+                PoDetail.po_id,
+                func.sum(PoDetail.qty).label("qty"),
+                func.sum(PoDetail.amount).label("amount"),
+                func.sum(PoDetail.tax_amount).label("tax_amount"),
+            )
+            .where(PoDetail.po_id == po_id)
+            .group_by(PoDetail.po_id)
+            .subquery()
+        )
+        await self.db.execute(
+            update(PoOrder)
+            .where(PoOrder.id == totals.c.po_id)
+            .values(
+                total_qty=totals.c.qty,
+                total_amount=totals.c.amount,
+                tax_amount=totals.c.tax_amount,
+                payable_amount=totals.c.amount + totals.c.tax_amount,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    
     async def get_by_id(self, po_id: int) -> Optional[PoOrder]:
         """根据ID获取采购订单"""
         result = await self.db.execute(
@@ -186,9 +275,10 @@ class PurchaseOrderService:
         if order.status != PoStatus.DRAFT.value:
             raise BusinessException(code="INVALID_STATUS", message="只有草稿状态的订单可以提交审批")
         
-        order.status = PoStatus.PENDING.value
+        await self._transition_status(
+            order, [PoStatus.DRAFT.value], status=PoStatus.PENDING.value
+        )
         await self.db.commit()
-        await self.db.refresh(order)
         return order
     
     async def approve(self, po_id: int, request: PoApproveRequest, approved_by: str) -> PoOrder:
@@ -201,20 +291,27 @@ class PurchaseOrderService:
             raise BusinessException(code="INVALID_STATUS", message="只有待审批状态的订单可以审批")
         
         if request.approved:
-            order.status = PoStatus.APPROVED.value
-            order.approved_by = approved_by
-            order.approved_at = datetime.utcnow()
+            await self._transition_status(
+                order,
+                [PoStatus.PENDING.value],
+                status=PoStatus.APPROVED.value,
+                approved_by=approved_by,
+                approved_at=datetime.utcnow()
+            )
             
             # 发布审批通过事件
             await self._publish_approved_event(order, approved_by)
         else:
             if not request.reject_reason:
                 raise BusinessException(code="REJECT_REASON_REQUIRED", message="拒绝时必须填写原因")
-            order.status = PoStatus.REJECTED.value
-            order.reject_reason = request.reject_reason
+            await self._transition_status(
+                order,
+                [PoStatus.PENDING.value],
+                status=PoStatus.REJECTED.value,
+                reject_reason=request.reject_reason
+            )
         
         await self.db.commit()
-        await self.db.refresh(order)
         return order
     
     async def receive(self, request: PoReceiveRequest, receiver: str) -> PoReceiveResponse:
@@ -285,8 +382,13 @@ class PurchaseOrderService:
                 "expiry_date": item.expiry_date.isoformat() if item.expiry_date else None
             })
         
-        # 检查是否全部收货完成
-        all_received = all(d.received_qty >= d.qty for d in order.details)
+        # 检查是否全部收货完成（查询前自动 flush 本次收货数量）
+        all_received = await self.db.scalar(
+            select(~exists().where(
+                PoDetail.po_id == order.id,
+                PoDetail.received_qty < PoDetail.qty
+            ))
+        )
         if all_received:
             order.status = PoStatus.COMPLETED.value
         else:
@@ -307,8 +409,16 @@ class PurchaseOrderService:
         await self.db.refresh(receive)
         return PoReceiveResponse.model_validate(receive)
     
-    async def query(self, query: PoOrderQuery) -> Tuple[List[PoOrderBrief], int]:
-        """查询采购订单列表"""
+    async def query(self, query: PoOrderQuery) -> Tuple[List[PoOrderBrief], int, Optional[str]]:
+        """
+        查询采购订单列表
+        
+        按 (created_at, id) 倒序排列。传入 cursor 时使用键集分页，
+        直接从上一页最后一条记录之后开始读取，深翻页无需扫描并丢弃 OFFSET 行。
+        
+        Returns:
+            (当前页数据, 总数, 下一页游标)
+        """
         stmt = select(PoOrder)
         
         if query.po_no:
@@ -322,18 +432,26 @@ class PurchaseOrderService:
         if query.end_date:
             stmt = stmt.where(PoOrder.order_date <= query.end_date)
         
-        # 总数
-        count_stmt = select(func.count()).select_from(stmt.subquery())
-        total = await self.db.scalar(count_stmt)
+        stmt = stmt.order_by(PoOrder.created_at.desc(), PoOrder.id.desc())
         
-        # 分页
-        stmt = stmt.order_by(PoOrder.created_at.desc())
-        stmt = stmt.offset((query.page - 1) * query.page_size).limit(query.page_size)
+        if query.cursor:
+            last_created_at, last_id = decode_po_cursor(query.cursor)
+            total = await self.db.scalar(build_count_stmt(stmt, single_table=True)) or 0
+            result = await self.db.execute(
+                stmt.where(or_(
+                    PoOrder.created_at < last_created_at,
+                    and_(PoOrder.created_at == last_created_at, PoOrder.id < last_id)
+                )).limit(query.page_size)
+            )
+            orders = list(result.scalars().all())
+        else:
+            orders, total = await paginate(self.db, stmt, query.page, query.page_size, single_table=True)
         
-        result = await self.db.execute(stmt)
-        orders = result.scalars().all()
+        next_cursor = None
+        if len(orders) == query.page_size:
+            next_cursor = encode_po_cursor(orders[-1].created_at, orders[-1].id)
         
-        return [PoOrderBrief.model_validate(o) for o in orders], total or 0
+        return _po_brief_list_adapter.validate_python(orders, from_attributes=True), total, next_cursor
     
     async def cancel(self, po_id: int) -> PoOrder:
         """取消采购订单"""
@@ -341,14 +459,34 @@ class PurchaseOrderService:
         if not order:
             raise BusinessException(code="NOT_FOUND", message="采购订单不存在")
         
-        if order.status not in [PoStatus.DRAFT.value, PoStatus.PENDING.value, PoStatus.REJECTED.value]:
+        cancellable = [PoStatus.DRAFT.value, PoStatus.PENDING.value, PoStatus.REJECTED.value]
+        if order.status not in cancellable:
             raise BusinessException(code="INVALID_STATUS", message="当前状态不允许取消")
         
-        order.status = PoStatus.CANCELLED.value
+        await self._transition_status(order, cancellable, status=PoStatus.CANCELLED.value)
         await self.db.commit()
-        await self.db.refresh(order)
         return order
     
+    async def _transition_status(self, order: PoOrder, from_statuses: List[str], **values):
+        """
+        条件更新订单状态
+        
+        仅当数据库中的状态仍在 from_statuses 内时才更新（乐观并发控制），
+        单条 UPDATE 完成状态流转，并同步到内存中的 order 对象，无需再 refresh。
+        """
+        result = await self.db.execute(
+            update(PoOrder)
+            .where(PoOrder.id == order.id, PoOrder.status.in_(from_statuses))
+            .values(updated_at=datetime.utcnow(), **values)
+            .execution_options(synchronize_session="evaluate")
+        )
+        if result.rowcount == 0:
+            raise BusinessException(
+                code="STATUS_CONFLICT",
+                message="订单状态已被修改，请刷新后重试",
+                status_code=409
+            )
+    
     async def _call_stock_in(self, warehouse_id: int, source_order_no: str, items: List[dict]):
         """调用库存服务入库"""
         stock_service_url = getattr(settings, 'stock_service_url', 'http://localhost:8002')
@@ -391,11 +529,7 @@ class PurchaseOrderService:
         )
         
         try:
-            await self.kafka.send(
-                topic="purchase-events",
-                key=order.po_no,
-                value=event.model_dump_json()
-            )
+            await self.kafka.send_raw("purchase-events", order.po_no, event.model_dump())
         except Exception as e:
             print(f"Failed to publish PoApproved event: {e}")
     
@@ -412,10 +546,6 @@ class PurchaseOrderService:
         )
         
         try:
-            await self.kafka.send(
-                topic="purchase-events",
-                key=po_no,
-                value=event.model_dump_json()
-            )
+            await self.kafka.send_raw("purchase-events", po_no, event.model_dump())
         except Exception as e:
             print(f"Failed to publish PoInStock event: {e}")
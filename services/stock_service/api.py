@@ -6,7 +6,7 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from erp_common.database import get_db
-from erp_common.schemas.base import Result, PageResult
+from erp_common.schemas.base import Result, PageResult, orjson_response
 from erp_common.auth import get_current_user, CurrentUser
 from erp_common.utils.kafka_utils import get_kafka_producer, KafkaProducer
 from erp_common.utils.redis_utils import get_redis_client, RedisClient
@@ -160,12 +160,12 @@ async def query_stock_moves(
         page_size=page_size
     )
     items, total = await service.query_stock_moves(query)
-    return Result.ok(data=PageResult(
+    return orjson_response(Result.ok(data=PageResult(
         items=items,
         total=total,
         page=page,
-        page_size=page_size
-    ))
+        size=page_size
+    )))
 
 
 # ============ 批量查询接口 ============
@@ -180,9 +180,5 @@ async def batch_query_stock(
     批量查询库存
     - 一次查询多个 SKU 的库存信息
     """
-    results = []
-    for sku_id in sku_ids:
-        stock_info = await service.get_stock_info(sku_id, warehouse_id)
-        if stock_info:
-            results.append(stock_info)
+    results = await service.batch_get_stock_info(sku_ids, warehouse_id)
     return Result.ok(data=results)
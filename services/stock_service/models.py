@@ -17,8 +17,8 @@ class Stock(Base):
     __tablename__ = "stock"
     
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
-    sku_id: Mapped[str] = mapped_column(String(50), nullable=False, index=True, comment="SKU ID")
-    warehouse_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True, comment="仓库ID")
+    sku_id: Mapped[str] = mapped_column(String(50), nullable=False, comment="SKU ID")
+    warehouse_id: Mapped[int] = mapped_column(BigInteger, nullable=False, comment="仓库ID")
     
     # 库存数量
     qty: Mapped[Decimal] = mapped_column(DECIMAL(18, 4), default=0, comment="实际库存数量")
@@ -36,9 +36,10 @@ class Stock(Base):
     details: Mapped[list["StockDetail"]] = relationship(back_populates="stock", lazy="selectin")
     
     __table_args__ = (
+        # 唯一约束同时承担按 sku_id 前缀查询的索引
         UniqueConstraint("sku_id", "warehouse_id", name="uk_sku_warehouse"),
-        Index("idx_stock_sku", "sku_id"),
-        Index("idx_stock_warehouse", "warehouse_id"),
+        # 按仓库（+SKU）查询的索引；数量/成本列频繁更新，不放进索引
+        Index("idx_stock_wh_sku", "warehouse_id", "sku_id"),
     )
 
 
@@ -151,5 +152,6 @@ class StockLock(Base):
     __table_args__ = (
         Index("idx_lock_sku", "sku_id"),
         Index("idx_lock_source", "source_type", "source_order_no"),
-        Index("idx_lock_status", "status"),
+        # 解锁/消耗按来源单号查找有效锁定记录（MySQL 不支持部分索引，用复合索引替代）
+        Index("idx_lock_order_status", "source_order_no", "status"),
     )
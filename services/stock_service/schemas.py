@@ -1,7 +1,7 @@
 """库存中心 - Pydantic Schema"""
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, List
+from typing import Optional, List, TypedDict
 from enum import Enum
 
 from pydantic import BaseModel, Field, ConfigDict
@@ -191,6 +191,25 @@ class StockMoveResponse(BaseModel):
     created_at: datetime
 
 
+class StockMoveDict(TypedDict):
+    """库存流水输出（仅用于查询接口直接序列化，字段与 StockMoveResponse 一致）"""
+    id: int
+    move_no: str
+    sku_id: str
+    warehouse_id: int
+    move_type: str
+    qty: Decimal
+    before_qty: Decimal
+    after_qty: Decimal
+    unit_cost: Decimal
+    source_type: str
+    source_order_no: Optional[str]
+    batch_no: Optional[str]
+    remark: Optional[str]
+    operator: Optional[str]
+    created_at: datetime
+
+
 class StockMoveQuery(BaseModel):
     """流水查询参数"""
     sku_id: Optional[str] = Field(None, description="SKU ID")
@@ -236,9 +255,13 @@ class StockQuery(BaseModel):
 
 # ============ 库存事件 ============
 
-class StockChangedEvent(BaseModel):
-    """库存变动事件"""
-    event_type: str = "StockChanged"
+class StockChangedEvent(TypedDict):
+    """
+    库存变动事件（Kafka 消息体）
+    
+    内部事件字段在发布处已确定类型，使用 TypedDict 仅做类型检查，不经过 Pydantic 校验
+    """
+    event_type: str  # 固定为 "StockChanged"
     sku_id: str
     warehouse_id: int
     move_type: str
@@ -246,5 +269,5 @@ class StockChangedEvent(BaseModel):
     before_qty: Decimal
     after_qty: Decimal
     source_type: str
-    source_order_no: Optional[str] = None
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    source_order_no: Optional[str]
+    timestamp: float  # Unix 时间戳（秒）
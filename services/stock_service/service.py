@@ -1,11 +1,19 @@
 """库存中心 - 业务服务层"""
-import uuid
+import asyncio
+import logging
+import os
+import time
+from functools import lru_cache
 from datetime import datetime
-from decimal import Decimal
-from typing import List, Optional, Tuple
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from sqlalchemy import select, update, and_
+from pydantic import BaseModel
+from sqlalchemy import select, update, and_, case, func, lambda_stmt, tuple_
+from sqlalchemy.sql.lambdas import StatementLambdaElement
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import lazyload
+from sqlalchemy.orm.attributes import get_history, set_committed_value
 
 from erp_common.exceptions import BusinessException
 from erp_common.utils.kafka_utils import KafkaProducer
@@ -18,24 +26,192 @@ from .schemas import (
     StockLockRequest, StockLockResponse,
     StockUnlockRequest, StockUnlockResponse,
     StockResponse, StockWithDetails, StockDetailResponse,
-    StockMoveResponse, StockMoveQuery, StockLockRecordResponse,
+    StockMoveDict, StockMoveQuery, StockLockRecordResponse,
     StockChangedEvent, MoveType, SourceType
 )
 
 
-def generate_move_no() -> str:
-    """生成流水号"""
-    return f"MV{datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:8].upper()}"
+logger = logging.getLogger(__name__)
 
+# 库存详情缓存时间（秒），出入库/锁定后主动失效
+STOCK_CACHE_TTL = 30
 
-def generate_lock_no() -> str:
-    """生成锁定单号"""
-    return f"LK{datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:8].upper()}"
 
+def stock_cache_key(sku_id: str, warehouse_id: int) -> str:
+    """库存详情缓存键"""
+    return f"stock:{sku_id}:{warehouse_id}"
 
-def generate_batch_no() -> str:
-    """生成批次号"""
-    return f"BN{datetime.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
+
+@lru_cache(maxsize=4096)
+def _event_key(sku_id: str) -> bytes:
+    """库存事件消息键（按 SKU 分区），缓存编码结果"""
+    return sku_id.encode("utf-8")
+
+
+def no_timestamp() -> str:
+    """单号时间部分（秒级），同一请求内的单号共用"""
+    return datetime.now().strftime("%Y%m%d%H%M%S")
+
+
+def _generate_nos(head: str, n: int, random_bytes: int) -> List[str]:
+    """
+    批量生成单号：前缀和时间 + 随机十六进制串
+    
+    随机部分一次 os.urandom 取出后切分
+    """
+    blob = os.urandom(random_bytes * n).hex().upper()
+    width = random_bytes * 2
+    return [f"{head}{blob[i * width:(i + 1) * width]}" for i in range(n)]
+
+
+def generate_move_nos(n: int, ts: Optional[str] = None) -> List[str]:
+    """批量生成流水号"""
+    return _generate_nos(f"MV{ts or no_timestamp()}", n, 4)
+
+
+def generate_lock_nos(n: int, ts: Optional[str] = None) -> List[str]:
+    """批量生成锁定单号"""
+    return _generate_nos(f"LK{ts or no_timestamp()}", n, 4)
+
+
+def generate_batch_nos(n: int, ts: Optional[str] = None) -> List[str]:
+    """批量生成批次号（时间部分只取日期）"""
+    return _generate_nos(f"BN{(ts or no_timestamp())[:8]}", n, 3)
+
+
+def _from_orm(model_cls: type, obj: Any) -> BaseModel:
+    """
+    由 ORM 对象直接构造响应模型（跳过校验）
+    
+    数据库中的数据在写入时已校验过，这里直接读取实例 __dict__ 中已加载的字段，
+    未加载的字段回退为属性访问
+    """
+    state = obj.__dict__
+    return model_cls.model_construct(**{
+        name: state[name] if name in state else getattr(obj, name)
+        for name in model_cls.model_fields
+    })
+
+
+def _detail_from_orm(detail: StockDetail) -> StockDetailResponse:
+    return _from_orm(StockDetailResponse, detail)
+
+
+def _stock_with_details(stock: Stock, details: List[StockDetail]) -> StockWithDetails:
+    """由库存主表和批次明细构造库存详情（跳过校验）"""
+    state = stock.__dict__
+    return StockWithDetails.model_construct(
+        **{
+            name: state[name] if name in state else getattr(stock, name)
+            for name in StockResponse.model_fields
+        },
+        details=[_detail_from_orm(d) for d in details]
+    )
+
+
+_MOVE_DICT_FIELDS = tuple(StockMoveDict.__annotations__)
+
+
+def _move_to_dict(move: StockMove) -> StockMoveDict:
+    """库存流水转换为输出字典（不构造 Pydantic 模型）"""
+    state = move.__dict__
+    return {
+        name: state[name] if name in state else getattr(move, name)
+        for name in _MOVE_DICT_FIELDS
+    }
+
+# 流水类型取值（避免循环内重复访问 Enum .value）
+_MT_IN = MoveType.IN.value
+_MT_OUT = MoveType.OUT.value
+_MT_LOCK = MoveType.LOCK.value
+_MT_UNLOCK = MoveType.UNLOCK.value
+
+# 库存主表中由出入库/锁定更新的数量和成本字段
+STOCK_QTY_FIELDS = ("qty", "locked_qty", "available_qty", "avg_cost")
+
+
+def _loaded_value(obj: Any, field: str) -> Any:
+    """字段在本次修改前的值（数据库中读到的值）"""
+    history = get_history(obj, field)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, field)
+
+
+# 成本计算使用的定点精度（6 位小数，高于数据库的 4 位）
+COST_QUANT = Decimal("0.0001")  # 与 stock.avg_cost 列 DECIMAL(18, 4) 的精度一致
+
+
+def weighted_avg_cost(qty_a: Decimal, cost_a: Decimal, qty_b: Decimal, cost_b: Decimal) -> Decimal:
+    """
+    移动加权平均成本（按列精度四舍五入，内存值与落库值一致）
+    
+    调用方保证 qty_a + qty_b > 0
+    """
+    total_value = qty_a * cost_a + qty_b * cost_b
+    return (total_value / (qty_a + qty_b)).quantize(COST_QUANT, ROUND_HALF_UP)
+
+
+def allocate_fifo(
+    details: List[StockDetail], need_qty: Decimal, use_locked: bool = False
+) -> Tuple[List[Tuple[StockDetail, Decimal]], Decimal, Decimal]:
+    """
+    按 FIFO 顺序计算批次扣减（纯计算，不修改明细）
+    
+    Args:
+        details: 按入库时间排序的批次明细
+        need_qty: 需要扣减的数量
+        use_locked: 是否可扣减批次的锁定数量（消耗锁定库存时为 True）
+    
+    Returns:
+        (每个批次的扣减数量列表, 出库成本, 未满足数量)
+    """
+    allocations = []
+    out_cost = Decimal("0")
+    remaining_qty = need_qty
+    for detail in details:
+        if remaining_qty <= 0:
+            break
+        available = detail.qty if use_locked else detail.qty - detail.locked_qty
+        deduct_qty = min(available, remaining_qty)
+        if deduct_qty <= 0:
+            continue
+        allocations.append((detail, deduct_qty))
+        out_cost += deduct_qty * detail.unit_cost
+        remaining_qty -= deduct_qty
+    return allocations, out_cost, remaining_qty
+
+
+def _apply_move_filters(stmt: StatementLambdaElement, query: StockMoveQuery) -> StatementLambdaElement:
+    """
+    追加库存流水查询条件
+    
+    使用 lambda 语句，编译后的 SQL 按条件组合缓存，参数值每次重新绑定
+    """
+    if query.sku_id:
+        sku_id = query.sku_id
+        stmt += lambda s: s.where(StockMove.sku_id == sku_id)
+    if query.warehouse_id:
+        warehouse_id = query.warehouse_id
+        stmt += lambda s: s.where(StockMove.warehouse_id == warehouse_id)
+    if query.move_type:
+        move_type = query.move_type.value
+        stmt += lambda s: s.where(StockMove.move_type == move_type)
+    if query.source_type:
+        source_type = query.source_type.value
+        stmt += lambda s: s.where(StockMove.source_type == source_type)
+    if query.source_order_no:
+        source_order_no = query.source_order_no
+        stmt += lambda s: s.where(StockMove.source_order_no == source_order_no)
+    if query.start_time:
+        start_time = query.start_time
+        stmt += lambda s: s.where(StockMove.created_at >= start_time)
+    if query.end_time:
+        end_time = query.end_time
+        stmt += lambda s: s.where(StockMove.created_at <= end_time)
+    return stmt
 
 
 class StockService:
@@ -48,13 +224,27 @@ class StockService:
     
     async def get_stock(self, sku_id: str, warehouse_id: int) -> Optional[Stock]:
         """获取库存记录"""
+        # 不触发 autoflush：库存主表和批次明细的修改在提交前统一批量回写
         result = await self.db.execute(
             select(Stock).where(
                 and_(Stock.sku_id == sku_id, Stock.warehouse_id == warehouse_id)
-            )
+            ).execution_options(autoflush=False)
         )
         return result.scalar_one_or_none()
     
+    async def load_stocks(self, keys: Set[Tuple[str, int]]) -> Dict[Tuple[str, int], Stock]:
+        """按 (sku_id, warehouse_id) 批量获取库存记录，一次查询"""
+        if not keys:
+            return {}
+        # 批次明细按需单独查询，不触发 details 关系的全量预加载
+        result = await self.db.execute(
+            select(Stock)
+            .options(lazyload(Stock.details))
+            .where(tuple_(Stock.sku_id, Stock.warehouse_id).in_(list(keys)))
+            .execution_options(autoflush=False)
+        )
+        return {(stock.sku_id, stock.warehouse_id): stock for stock in result.scalars().all()}
+    
     async def get_or_create_stock(self, sku_id: str, warehouse_id: int) -> Stock:
         """获取或创建库存记录"""
         stock = await self.get_stock(sku_id, warehouse_id)
@@ -79,24 +269,51 @@ class StockService:
         - 记录库存流水
         - 发布库存变动事件
         """
+        source_type = request.source_type.value
         move_nos = []
+        touched_stocks = []
+        details = []
+        moves = []
+        events = []
+        
+        # 1. 批量获取库存记录，不存在的一次性创建
+        stocks = await self.load_stocks({(item.sku_id, request.warehouse_id) for item in request.items})
+        new_stocks = [
+            Stock(
+                sku_id=sku_id,
+                warehouse_id=request.warehouse_id,
+                qty=Decimal("0"),
+                locked_qty=Decimal("0"),
+                available_qty=Decimal("0"),
+                avg_cost=Decimal("0")
+            )
+            for sku_id in dict.fromkeys(item.sku_id for item in request.items)
+            if (sku_id, request.warehouse_id) not in stocks
+        ]
+        if new_stocks:
+            self.db.add_all(new_stocks)
+            await self.db.flush()
+            stocks.update({(stock.sku_id, stock.warehouse_id): stock for stock in new_stocks})
+        
+        ts = no_timestamp()
+        new_move_nos = iter(generate_move_nos(len(request.items), ts))
+        new_batch_nos = iter(generate_batch_nos(len(request.items), ts))
         
         for item in request.items:
-            # 1. 获取或创建库存记录
-            stock = await self.get_or_create_stock(item.sku_id, request.warehouse_id)
+            stock = stocks[(item.sku_id, request.warehouse_id)]
+            touched_stocks.append(stock)
             before_qty = stock.qty
             
             # 2. 计算移动加权平均成本
             if stock.qty + item.qty > 0:
-                total_value = stock.qty * stock.avg_cost + item.qty * item.unit_cost
-                stock.avg_cost = total_value / (stock.qty + item.qty)
+                stock.avg_cost = weighted_avg_cost(stock.qty, stock.avg_cost, item.qty, item.unit_cost)
             
             # 3. 更新库存数量
             stock.qty += item.qty
             stock.available_qty = stock.qty - stock.locked_qty
             
             # 4. 创建批次明细
-            batch_no = item.batch_no or generate_batch_no()
+            batch_no = item.batch_no or next(new_batch_nos)
             detail = StockDetail(
                 stock_id=stock.id,
                 sku_id=item.sku_id,
@@ -107,44 +324,48 @@ class StockService:
                 qty=item.qty,
                 locked_qty=Decimal("0"),
                 unit_cost=item.unit_cost,
-                source_type=request.source_type.value,
+                source_type=source_type,
                 source_order_no=request.source_order_no
             )
-            self.db.add(detail)
+            details.append(detail)
             
             # 5. 记录库存流水
-            move_no = generate_move_no()
+            move_no = next(new_move_nos)
             move = StockMove(
                 move_no=move_no,
                 sku_id=item.sku_id,
                 warehouse_id=request.warehouse_id,
-                move_type=MoveType.IN.value,
+                move_type=_MT_IN,
                 qty=item.qty,
                 before_qty=before_qty,
                 after_qty=stock.qty,
                 unit_cost=item.unit_cost,
-                source_type=request.source_type.value,
+                source_type=source_type,
                 source_order_no=request.source_order_no,
                 batch_no=batch_no,
                 remark=request.remark,
                 operator=operator
             )
-            self.db.add(move)
+            moves.append(move)
             move_nos.append(move_no)
             
-            # 6. 发布库存变动事件
-            await self._publish_stock_event(
+            # 6. 收集库存变动事件，提交后统一发布
+            events.append(dict(
                 sku_id=item.sku_id,
                 warehouse_id=request.warehouse_id,
-                move_type=MoveType.IN.value,
+                move_type=_MT_IN,
                 qty=item.qty,
                 before_qty=before_qty,
                 after_qty=stock.qty,
-                source_type=request.source_type.value,
+                source_type=source_type,
                 source_order_no=request.source_order_no
-            )
+            ))
         
+        self.db.add_all(details)
+        self.db.add_all(moves)
+        await self._write_back_stocks(touched_stocks)
         await self.db.commit()
+        await self._after_commit(touched_stocks, events)
         return StockInResponse(success=True, move_nos=move_nos, message="入库成功")
     
     async def stock_out(self, request: StockOutRequest, operator: str = None) -> StockOutResponse:
@@ -156,17 +377,28 @@ class StockService:
         - 记录库存流水
         - 发布库存变动事件
         """
+        source_type = request.source_type.value
         move_nos = []
         total_cost = Decimal("0")
+        touched_stocks = []
+        touched_details = []
+        moves = []
+        events = []
+        
+        stocks = await self.load_stocks({(item.sku_id, request.warehouse_id) for item in request.items})
+        new_move_nos = iter(generate_move_nos(len(request.items)))
+        # 本次请求内各 SKU 已扣减数量：批次查询读到的是扣减前的数据库值，需多取这部分
+        deducted_qty: Dict[str, Decimal] = {}
         
         for item in request.items:
             # 1. 获取库存记录
-            stock = await self.get_stock(item.sku_id, request.warehouse_id)
+            stock = stocks.get((item.sku_id, request.warehouse_id))
             if not stock:
                 raise BusinessException(
                     code="STOCK_NOT_FOUND",
                     message=f"库存记录不存在: SKU={item.sku_id}, 仓库={request.warehouse_id}"
                 )
+            touched_stocks.append(stock)
             
             # 2. 校验可用库存
             if stock.available_qty < item.qty:
@@ -176,27 +408,22 @@ class StockService:
                 )
             
             before_qty = stock.qty
-            remaining_qty = item.qty
-            out_cost = Decimal("0")
             
             # 3. FIFO 扣减批次明细
-            details = await self._get_available_details(item.sku_id, request.warehouse_id, item.batch_no)
-            for detail in details:
-                if remaining_qty <= 0:
-                    break
-                
-                available = detail.qty - detail.locked_qty
-                deduct_qty = min(available, remaining_qty)
-                
-                detail.qty -= deduct_qty
-                out_cost += deduct_qty * detail.unit_cost
-                remaining_qty -= deduct_qty
-            
+            prior_qty = deducted_qty.get(item.sku_id, Decimal("0"))
+            details = await self._get_available_details(
+                item.sku_id, request.warehouse_id, item.batch_no, need_qty=prior_qty + item.qty
+            )
+            allocations, out_cost, remaining_qty = allocate_fifo(details, item.qty)
             if remaining_qty > 0:
                 raise BusinessException(
                     code="INSUFFICIENT_BATCH_STOCK",
                     message=f"批次库存不足以扣减: SKU={item.sku_id}"
                 )
+            for detail, deduct_qty in allocations:
+                detail.qty -= deduct_qty
+                touched_details.append(detail)
+            deducted_qty[item.sku_id] = prior_qty + item.qty
             
             # 4. 更新库存主表
             stock.qty -= item.qty
@@ -204,38 +431,42 @@ class StockService:
             total_cost += out_cost
             
             # 5. 记录库存流水
-            move_no = generate_move_no()
+            move_no = next(new_move_nos)
             move = StockMove(
                 move_no=move_no,
                 sku_id=item.sku_id,
                 warehouse_id=request.warehouse_id,
-                move_type=MoveType.OUT.value,
+                move_type=_MT_OUT,
                 qty=item.qty,
                 before_qty=before_qty,
                 after_qty=stock.qty,
                 unit_cost=out_cost / item.qty if item.qty > 0 else Decimal("0"),
-                source_type=request.source_type.value,
+                source_type=source_type,
                 source_order_no=request.source_order_no,
                 batch_no=item.batch_no,
                 remark=request.remark,
                 operator=operator
             )
-            self.db.add(move)
+            moves.append(move)
             move_nos.append(move_no)
             
-            # 6. 发布库存变动事件
-            await self._publish_stock_event(
+            # 6. 收集库存变动事件，提交后统一发布
+            events.append(dict(
                 sku_id=item.sku_id,
                 warehouse_id=request.warehouse_id,
-                move_type=MoveType.OUT.value,
+                move_type=_MT_OUT,
                 qty=item.qty,
                 before_qty=before_qty,
                 after_qty=stock.qty,
-                source_type=request.source_type.value,
+                source_type=source_type,
                 source_order_no=request.source_order_no
-            )
+            ))
         
+        self.db.add_all(moves)
+        await self._write_back_stocks(touched_stocks, check_available=True)
+        await self._bulk_update(StockDetail, touched_details, ("qty",))
         await self.db.commit()
+        await self._after_commit(touched_stocks, events)
         return StockOutResponse(success=True, move_nos=move_nos, total_cost=total_cost, message="出库成功")
     
     async def lock_stock(self, request: StockLockRequest, operator: str = None) -> StockLockResponse:
@@ -246,16 +477,26 @@ class StockService:
         - 创建锁定记录
         - 记录库存流水
         """
+        source_type = request.source_type  # 锁定请求的来源类型是字符串（默认 ORDER），不是 SourceType 枚举
         lock_nos = []
+        touched_stocks = []
+        lock_records = []
+        moves = []
+        
+        stocks = await self.load_stocks({(item.sku_id, request.warehouse_id) for item in request.items})
+        ts = no_timestamp()
+        new_lock_nos = iter(generate_lock_nos(len(request.items), ts))
+        new_move_nos = iter(generate_move_nos(len(request.items), ts))
         
         for item in request.items:
             # 1. 获取库存记录
-            stock = await self.get_stock(item.sku_id, request.warehouse_id)
+            stock = stocks.get((item.sku_id, request.warehouse_id))
             if not stock:
                 raise BusinessException(
                     code="STOCK_NOT_FOUND",
                     message=f"库存记录不存在: SKU={item.sku_id}"
                 )
+            touched_stocks.append(stock)
             
             # 2. 校验可用库存
             if stock.available_qty < item.qty:
@@ -270,38 +511,42 @@ class StockService:
             stock.available_qty = stock.qty - stock.locked_qty
             
             # 4. 创建锁定记录
-            lock_no = generate_lock_no()
+            lock_no = next(new_lock_nos)
             lock_record = StockLock(
                 lock_no=lock_no,
                 sku_id=item.sku_id,
                 warehouse_id=request.warehouse_id,
                 locked_qty=item.qty,
                 status="LOCKED",
-                source_type=request.source_type,
+                source_type=source_type,
                 source_order_no=request.source_order_no,
                 operator=operator
             )
-            self.db.add(lock_record)
+            lock_records.append(lock_record)
             lock_nos.append(lock_no)
             
             # 5. 记录库存流水
-            move_no = generate_move_no()
+            move_no = next(new_move_nos)
             move = StockMove(
                 move_no=move_no,
                 sku_id=item.sku_id,
                 warehouse_id=request.warehouse_id,
-                move_type=MoveType.LOCK.value,
+                move_type=_MT_LOCK,
                 qty=item.qty,
                 before_qty=before_locked,
                 after_qty=stock.locked_qty,
                 unit_cost=Decimal("0"),
-                source_type=request.source_type,
+                source_type=source_type,
                 source_order_no=request.source_order_no,
                 operator=operator
             )
-            self.db.add(move)
+            moves.append(move)
         
+        self.db.add_all(lock_records)
+        self.db.add_all(moves)
+        await self._write_back_stocks(touched_stocks, check_available=True)
         await self.db.commit()
+        await self._invalidate_stock_cache(touched_stocks)
         return StockLockResponse(success=True, lock_nos=lock_nos, message="锁定成功")
     
     async def unlock_stock(self, request: StockUnlockRequest, operator: str = None) -> StockUnlockResponse:
@@ -329,22 +574,26 @@ class StockService:
             raise BusinessException(code="LOCK_NOT_FOUND", message="未找到有效的锁定记录")
         
         unlocked_count = 0
+        touched_stocks = []
+        new_move_nos = iter(generate_move_nos(len(lock_records)))
+        stocks = await self.load_stocks({(r.sku_id, r.warehouse_id) for r in lock_records})
         
         for lock_record in lock_records:
             # 获取库存记录
-            stock = await self.get_stock(lock_record.sku_id, lock_record.warehouse_id)
+            stock = stocks.get((lock_record.sku_id, lock_record.warehouse_id))
             if stock:
+                touched_stocks.append(stock)
                 before_locked = stock.locked_qty
                 stock.locked_qty -= lock_record.locked_qty
                 stock.available_qty = stock.qty - stock.locked_qty
                 
                 # 记录库存流水
-                move_no = generate_move_no()
+                move_no = next(new_move_nos)
                 move = StockMove(
                     move_no=move_no,
                     sku_id=lock_record.sku_id,
                     warehouse_id=lock_record.warehouse_id,
-                    move_type=MoveType.UNLOCK.value,
+                    move_type=_MT_UNLOCK,
                     qty=lock_record.locked_qty,
                     before_qty=before_locked,
                     after_qty=stock.locked_qty,
@@ -360,7 +609,9 @@ class StockService:
             lock_record.unlocked_at = datetime.utcnow()
             unlocked_count += 1
         
+        await self._write_back_stocks(touched_stocks)
         await self.db.commit()
+        await self._invalidate_stock_cache(touched_stocks)
         return StockUnlockResponse(success=True, unlocked_count=unlocked_count, message="解锁成功")
     
     async def consume_locked_stock(self, source_order_no: str, operator: str = None) -> StockOutResponse:
@@ -370,43 +621,51 @@ class StockService:
         - 执行出库
         - 更新锁定记录状态为已消耗
         """
-        # 查找锁定记录
+        # 查找锁定记录及对应库存记录（一次查询）
         result = await self.db.execute(
-            select(StockLock).where(
+            select(StockLock, Stock)
+            .outerjoin(Stock, and_(
+                Stock.sku_id == StockLock.sku_id,
+                Stock.warehouse_id == StockLock.warehouse_id
+            ))
+            .options(lazyload(Stock.details))
+            .where(
                 and_(
                     StockLock.source_order_no == source_order_no,
                     StockLock.status == "LOCKED"
                 )
             )
         )
-        lock_records = result.scalars().all()
+        rows = result.all()
         
-        if not lock_records:
+        if not rows:
             raise BusinessException(code="LOCK_NOT_FOUND", message=f"未找到订单 {source_order_no} 的锁定记录")
         
         move_nos = []
         total_cost = Decimal("0")
+        touched_stocks = []
+        touched_details = []
+        events = []
+        new_move_nos = iter(generate_move_nos(len(rows)))
         
-        for lock_record in lock_records:
-            # 获取库存记录
-            stock = await self.get_stock(lock_record.sku_id, lock_record.warehouse_id)
+        # 所有 SKU 的可用批次一次查询
+        details_by_key = await self._load_available_details(
+            {(lock_record.sku_id, lock_record.warehouse_id) for lock_record, stock in rows if stock}
+        )
+        
+        for lock_record, stock in rows:
             if not stock:
                 continue
+            touched_stocks.append(stock)
             
             before_qty = stock.qty
-            remaining_qty = lock_record.locked_qty
-            out_cost = Decimal("0")
             
             # FIFO 扣减批次明细
-            details = await self._get_available_details(lock_record.sku_id, lock_record.warehouse_id, None)
-            for detail in details:
-                if remaining_qty <= 0:
-                    break
-                
-                deduct_qty = min(detail.qty, remaining_qty)
+            details = details_by_key.get((lock_record.sku_id, lock_record.warehouse_id), [])
+            allocations, out_cost, _ = allocate_fifo(details, lock_record.locked_qty, use_locked=True)
+            for detail, deduct_qty in allocations:
                 detail.qty -= deduct_qty
-                out_cost += deduct_qty * detail.unit_cost
-                remaining_qty -= deduct_qty
+                touched_details.append(detail)
             
             # 更新库存主表
             stock.qty -= lock_record.locked_qty
@@ -415,12 +674,12 @@ class StockService:
             total_cost += out_cost
             
             # 记录库存流水
-            move_no = generate_move_no()
+            move_no = next(new_move_nos)
             move = StockMove(
                 move_no=move_no,
                 sku_id=lock_record.sku_id,
                 warehouse_id=lock_record.warehouse_id,
-                move_type=MoveType.OUT.value,
+                move_type=_MT_OUT,
                 qty=lock_record.locked_qty,
                 before_qty=before_qty,
                 after_qty=stock.qty,
@@ -436,23 +695,36 @@ class StockService:
             lock_record.status = "CONSUMED"
             lock_record.unlocked_at = datetime.utcnow()
             
-            # 发布库存变动事件
-            await self._publish_stock_event(
+            # 收集库存变动事件，提交后统一发布
+            events.append(dict(
                 sku_id=lock_record.sku_id,
                 warehouse_id=lock_record.warehouse_id,
-                move_type=MoveType.OUT.value,
+                move_type=_MT_OUT,
                 qty=lock_record.locked_qty,
                 before_qty=before_qty,
                 after_qty=stock.qty,
                 source_type="SALE",
                 source_order_no=source_order_no
-            )
+            ))
         
+        await self._write_back_stocks(touched_stocks)
+        await self._bulk_update(StockDetail, touched_details, ("qty",))
         await self.db.commit()
+        await self._after_commit(touched_stocks, events)
         return StockOutResponse(success=True, move_nos=move_nos, total_cost=total_cost, message="出库成功")
     
     async def get_stock_info(self, sku_id: str, warehouse_id: int) -> Optional[StockWithDetails]:
-        """获取库存详情（含批次明细）"""
+        """获取库存详情（含批次明细，优先读取 Redis 缓存，Redis 不可用时直接查库）"""
+        cache_key = stock_cache_key(sku_id, warehouse_id)
+        if self.redis:
+            try:
+                cached = await self.redis.get(cache_key)
+            except Exception as e:
+                logger.warning(f"Failed to read stock cache: {e}")
+                cached = None
+            if cached:
+                return StockWithDetails.model_validate_json(cached)
+        
         stock = await self.get_stock(sku_id, warehouse_id)
         if not stock:
             return None
@@ -469,72 +741,270 @@ class StockService:
         )
         details = result.scalars().all()
         
-        return StockWithDetails(
-            id=stock.id,
-            sku_id=stock.sku_id,
-            warehouse_id=stock.warehouse_id,
-            qty=stock.qty,
-            locked_qty=stock.locked_qty,
-            available_qty=stock.available_qty,
-            avg_cost=stock.avg_cost,
-            created_at=stock.created_at,
-            updated_at=stock.updated_at,
-            details=[StockDetailResponse.model_validate(d) for d in details]
+        info = _stock_with_details(stock, details)
+        if self.redis:
+            try:
+                await self.redis.set(cache_key, info.model_dump_json(), expire=STOCK_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Failed to write stock cache: {e}")
+        return info
+    
+    async def batch_get_stock_info(self, sku_ids: List[str], warehouse_id: int) -> List[StockWithDetails]:
+        """批量获取库存详情（含批次明细），主表和明细各一次查询"""
+        if not sku_ids:
+            return []
+        
+        # 明细单独按 qty > 0 过滤查询，不触发 details 关系的全量预加载
+        stock_result = await self.db.execute(
+            select(Stock)
+            .options(lazyload(Stock.details))
+            .where(and_(Stock.sku_id.in_(sku_ids), Stock.warehouse_id == warehouse_id))
         )
+        stocks = {stock.sku_id: stock for stock in stock_result.scalars().all()}
+        if not stocks:
+            return []
+        
+        detail_result = await self.db.execute(
+            select(StockDetail).where(
+                and_(
+                    StockDetail.sku_id.in_(list(stocks)),
+                    StockDetail.warehouse_id == warehouse_id,
+                    StockDetail.qty > 0
+                )
+            ).order_by(StockDetail.created_at)
+        )
+        details_by_sku: dict[str, List[StockDetail]] = {}
+        for d in detail_result.scalars().all():
+            details_by_sku.setdefault(d.sku_id, []).append(d)
+        
+        # 按请求顺序返回，忽略不存在的 SKU
+        results = []
+        for sku_id in dict.fromkeys(sku_ids):
+            stock = stocks.get(sku_id)
+            if stock:
+                results.append(_stock_with_details(stock, details_by_sku.get(sku_id, [])))
+        return results
     
-    async def query_stock_moves(self, query: StockMoveQuery) -> Tuple[List[StockMoveResponse], int]:
+    async def query_stock_moves(self, query: StockMoveQuery) -> Tuple[List[StockMoveDict], int]:
         """查询库存流水"""
-        stmt = select(StockMove)
-        
-        if query.sku_id:
-            stmt = stmt.where(StockMove.sku_id == query.sku_id)
-        if query.warehouse_id:
-            stmt = stmt.where(StockMove.warehouse_id == query.warehouse_id)
-        if query.move_type:
-            stmt = stmt.where(StockMove.move_type == query.move_type.value)
-        if query.source_type:
-            stmt = stmt.where(StockMove.source_type == query.source_type.value)
-        if query.source_order_no:
-            stmt = stmt.where(StockMove.source_order_no == query.source_order_no)
-        if query.start_time:
-            stmt = stmt.where(StockMove.created_at >= query.start_time)
-        if query.end_time:
-            stmt = stmt.where(StockMove.created_at <= query.end_time)
-        
-        # 总数
-        from sqlalchemy import func
-        count_stmt = select(func.count()).select_from(stmt.subquery())
-        total = await self.db.scalar(count_stmt)
-        
-        # 分页
-        stmt = stmt.order_by(StockMove.created_at.desc())
-        stmt = stmt.offset((query.page - 1) * query.page_size).limit(query.page_size)
+        # 分页，总数用窗口函数随当前页一起返回
+        offset = (query.page - 1) * query.page_size
+        limit = query.page_size
+        page_stmt = _apply_move_filters(
+            lambda_stmt(lambda: select(StockMove, func.count().over().label("total"))), query
+        )
+        page_stmt += lambda s: s.order_by(StockMove.created_at.desc()).offset(offset).limit(limit)
+        rows = (await self.db.execute(page_stmt)).all()
+        moves = [row[0] for row in rows]
         
-        result = await self.db.execute(stmt)
-        moves = result.scalars().all()
+        if rows:
+            total = rows[0].total
+        elif query.page > 1:
+            # 页码超出范围时窗口函数无结果，单独统计总数
+            count_stmt = _apply_move_filters(
+                lambda_stmt(lambda: select(func.count()).select_from(StockMove)), query
+            )
+            total = await self.db.scalar(count_stmt)
+        else:
+            total = 0
         
-        return [StockMoveResponse.model_validate(m) for m in moves], total or 0
+        return [_move_to_dict(m) for m in moves], total or 0
     
-    async def _get_available_details(
-        self, sku_id: str, warehouse_id: int, batch_no: Optional[str]
-    ) -> List[StockDetail]:
-        """获取可用批次明细（FIFO 排序）"""
-        stmt = select(StockDetail).where(
-            and_(
-                StockDetail.sku_id == sku_id,
-                StockDetail.warehouse_id == warehouse_id,
+    async def _write_back_stocks(self, stocks: Iterable[Stock], check_available: bool = False):
+        """
+        回写库存主表（一条 UPDATE，按增量更新）
+        
+        以读取后的变化量更新（qty = qty + :delta），而不是覆盖为内存中的值，
+        并发修改同一 SKU 时不会丢失更新；移动加权平均成本同样基于数据库当前值计算。
+        check_available 为 True 时在 WHERE 中校验更新后可用库存不为负，
+        被并发扣减导致不足时整单失败。
+        """
+        stocks_by_id = {stock.id: stock for stock in stocks}
+        if not stocks_by_id:
+            return
+        
+        qty_deltas, locked_deltas, value_deltas = {}, {}, {}
+        for stock_id, stock in stocks_by_id.items():
+            old_qty = _loaded_value(stock, "qty")
+            old_cost = _loaded_value(stock, "avg_cost")
+            qty_deltas[stock_id] = stock.qty - old_qty
+            locked_deltas[stock_id] = stock.locked_qty - _loaded_value(stock, "locked_qty")
+            if stock.avg_cost != old_cost:
+                # 本次入库增加的库存金额
+                value_deltas[stock_id] = stock.qty * stock.avg_cost - old_qty * old_cost
+        
+        def delta_case(deltas: Dict[int, Decimal]):
+            return case(deltas, value=Stock.id, else_=Decimal("0"))
+        
+        available_deltas = {i: qty_deltas[i] - locked_deltas[i] for i in stocks_by_id}
+        values = []
+        if value_deltas:
+            # MySQL 按 SET 顺序求值，成本必须在 qty 更新之前计算
+            values.append((Stock.avg_cost, case(
+                {
+                    stock_id: case(
+                        (
+                            Stock.qty + qty_deltas[stock_id] > 0,
+                            (Stock.qty * Stock.avg_cost + value_delta) / (Stock.qty + qty_deltas[stock_id])
+                        ),
+                        else_=Stock.avg_cost
+                    )
+                    for stock_id, value_delta in value_deltas.items()
+                },
+                value=Stock.id,
+                else_=Stock.avg_cost
+            )))
+        values += [
+            (Stock.qty, Stock.qty + delta_case(qty_deltas)),
+            (Stock.locked_qty, Stock.locked_qty + delta_case(locked_deltas)),
+            (Stock.available_qty, Stock.available_qty + delta_case(available_deltas)),
+        ]
+        
+        stmt = update(Stock).where(Stock.id.in_(list(stocks_by_id)))
+        if check_available:
+            stmt = stmt.where(Stock.available_qty + delta_case(available_deltas) >= 0)
+        # 不触发 autoflush：否则会先把内存中的新值写入数据库，增量再叠加一次
+        result = await self.db.execute(
+            stmt.ordered_values(*values).execution_options(synchronize_session=False, autoflush=False)
+        )
+        if result.rowcount != len(stocks_by_id):
+            raise BusinessException(
+                code="INSUFFICIENT_STOCK",
+                message="可用库存不足（库存已被并发修改），请重试"
+            )
+        
+        for stock in stocks_by_id.values():
+            for field in STOCK_QTY_FIELDS:
+                set_committed_value(stock, field, getattr(stock, field))
+    
+    async def _bulk_update(self, model: type, rows: Iterable[Any], fields: Tuple[str, ...]):
+        """
+        批量回写已修改的记录（批次明细）
+        
+        用一条 CASE UPDATE 代替 ORM flush 时的逐行 UPDATE，
+        并将内存对象的对应字段标记为已提交，避免 flush 时重复更新
+        """
+        rows_by_id = {row.id: row for row in rows}
+        if not rows_by_id:
+            return
+        
+        await self.db.execute(
+            update(model)
+            .where(model.id.in_(list(rows_by_id)))
+            .values({
+                field: case(
+                    {row_id: getattr(row, field) for row_id, row in rows_by_id.items()},
+                    value=model.id,
+                    else_=getattr(model, field)
+                )
+                for field in fields
+            })
+            .execution_options(synchronize_session=False, autoflush=False)
+        )
+        
+        for row in rows_by_id.values():
+            for field in fields:
+                set_committed_value(row, field, getattr(row, field))
+    
+    async def _load_available_details(
+        self, keys: Set[Tuple[str, int]]
+    ) -> Dict[Tuple[str, int], List[StockDetail]]:
+        """按 (sku_id, warehouse_id) 批量获取可用批次明细（各自 FIFO 排序）"""
+        if not keys:
+            return {}
+        result = await self.db.execute(
+            select(StockDetail)
+            .where(
+                tuple_(StockDetail.sku_id, StockDetail.warehouse_id).in_(list(keys)),
                 StockDetail.qty > 0
             )
+            .order_by(StockDetail.created_at)
+            .execution_options(autoflush=False)
         )
+        details_by_key: Dict[Tuple[str, int], List[StockDetail]] = {}
+        for detail in result.scalars().all():
+            details_by_key.setdefault((detail.sku_id, detail.warehouse_id), []).append(detail)
+        return details_by_key
+    
+    async def _get_available_details(
+        self, sku_id: str, warehouse_id: int, batch_no: Optional[str], need_qty: Optional[Decimal] = None
+    ) -> List[StockDetail]:
+        """
+        获取可用批次明细（FIFO 排序）
         
+        传入 need_qty 时只返回满足该数量所需的最少批次：
+        按 FIFO 顺序计算之前批次的累计可用数量，累计值已达到 need_qty 的批次不再读取。
+        """
+        conditions = [
+            StockDetail.sku_id == sku_id,
+            StockDetail.warehouse_id == warehouse_id,
+            StockDetail.qty > 0
+        ]
         if batch_no:
-            stmt = stmt.where(StockDetail.batch_no == batch_no)
+            conditions.append(StockDetail.batch_no == batch_no)
         
-        stmt = stmt.order_by(StockDetail.created_at)  # FIFO
+        fifo_order = (StockDetail.created_at, StockDetail.id)
+        if need_qty is None:
+            stmt = select(StockDetail).where(*conditions)
+        else:
+            available = StockDetail.qty - StockDetail.locked_qty
+            ranked = (
+                select(
+                    StockDetail.id.label("id"),
+                    (func.sum(available).over(order_by=fifo_order) - available).label("cum_prev")
+                )
+                .where(*conditions)
+                .subquery()
+            )
+            stmt = (
+                select(StockDetail)
+                .join(ranked, ranked.c.id == StockDetail.id)
+                .where(ranked.c.cum_prev < need_qty)
+            )
+        
+        stmt = stmt.order_by(*fifo_order).execution_options(autoflush=False)  # FIFO
         
         result = await self.db.execute(stmt)
         return list(result.scalars().all())
     
+    async def _after_commit(self, stocks: List[Stock], events: List[Dict[str, Any]]):
+        """
+        事务提交后的收尾：清除库存缓存、发布库存事件
+        
+        两者互不依赖，并发执行；各自内部处理异常，不影响已提交的结果。
+        事件必须在提交成功后才进入 Kafka 缓冲区，因此不与提交本身并发。
+        """
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._invalidate_stock_cache(stocks))
+            tg.create_task(self._publish_stock_events(events))
+    
+    async def _invalidate_stock_cache(self, stocks: Iterable[Stock]):
+        """清除库存详情缓存（事务提交后调用，失败只记录日志）"""
+        if not self.redis:
+            return
+        keys = {stock_cache_key(stock.sku_id, stock.warehouse_id) for stock in stocks}
+        if not keys:
+            return
+        try:
+            await self.redis.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate stock cache: {e}")
+    
+    async def _publish_stock_events(self, events: List[Dict[str, Any]]):
+        """
+        发布一组库存变动事件（在事务提交后调用）
+        
+        先全部放入生产者缓冲区，再统一等待投递结果，同一请求的事件合并发送
+        """
+        if not self.kafka or not events:
+            return
+        
+        pending = [await self._publish_stock_event(**event) for event in events]
+        results = await asyncio.gather(*(f for f in pending if f is not None), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to publish stock event: {result}")
+    
     async def _publish_stock_event(
         self,
         sku_id: str,
@@ -545,28 +1015,27 @@ class StockService:
         after_qty: Decimal,
         source_type: str,
         source_order_no: Optional[str]
-    ):
-        """发布库存变动事件"""
+    ) -> Optional[asyncio.Future]:
+        """将库存变动事件放入发送缓冲区，返回投递结果 Future"""
         if not self.kafka:
-            return
+            return None
         
-        event = StockChangedEvent(
-            sku_id=sku_id,
-            warehouse_id=warehouse_id,
-            move_type=move_type,
-            qty=qty,
-            before_qty=before_qty,
-            after_qty=after_qty,
-            source_type=source_type,
-            source_order_no=source_order_no
-        )
+        event: StockChangedEvent = {
+            "event_type": "StockChanged",
+            "sku_id": sku_id,
+            "warehouse_id": warehouse_id,
+            "move_type": move_type,
+            "qty": qty,
+            "before_qty": before_qty,
+            "after_qty": after_qty,
+            "source_type": source_type,
+            "source_order_no": source_order_no,
+            "timestamp": time.time(),
+        }
         
         try:
-            await self.kafka.send(
-                topic="stock-events",
-                key=sku_id,
-                value=event.model_dump_json()
-            )
+            return await self.kafka.enqueue_raw("stock-events", _event_key(sku_id), event)
         except Exception as e:
             # 记录日志但不影响主流程
-            print(f"Failed to publish stock event: {e}")
+            logger.warning(f"Failed to publish stock event: {e}")
+            return None
@@ -2,13 +2,16 @@
 用户中心 - API 路由
 """
 
+from typing import Optional
+from urllib.parse import quote
+
 from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from erp_common.auth import CurrentUser, get_current_user, require_roles
+from erp_common.auth import CurrentUser, get_current_user, require_roles, security
 from erp_common.database import get_db
-from erp_common.schemas.base import PageResult, Result
-from erp_common.utils.jwt_utils import decode_token
+from erp_common.schemas.base import PageResult, Result, orjson_response
 from erp_common.utils.redis_utils import RedisClient, get_redis
 
 from .schemas import (
@@ -24,7 +27,6 @@ from .schemas import (
     UserCreate,
     UserQuery,
     UserResponse,
-    UserRoleResponse,
     UserUpdate,
     OrgCreate,
     OrgUpdate,
@@ -33,13 +35,69 @@ from .schemas import (
     AuditLogQuery,
     PermissionResponse,
     RolePermissionAssign,
+    ORG_LIST_ADAPTER,
+)
+from .service import (
+    AuthService,
+    RoleService,
+    UserService,
+    OrgService,
+    AuditLogService,
+    PermissionService,
+    verify_access_token,
 )
-from .service import AuthService, RoleService, UserService, OrgService, AuditLogService, PermissionService
 
 router = APIRouter(prefix="/user", tags=["用户中心"])
 
 
-# ==================== 健康检查（必须放在最前面） ====================
+# ==================== 网关鉴权（放在路由表最前面） ====================
+# Nginx auth_request 对每个代理请求都会调用 /verify，路由按注册顺序匹配，越靠前匹配越快
+
+@router.get("/verify", summary="验证 Token（供 Nginx auth_request 使用）")
+async def verify_token(
+    response: Response,
+    authorization: str = Header(None),
+    redis: RedisClient = Depends(get_redis),
+):
+    """
+    验证 Token 有效性
+    
+    Nginx auth_request 调用此接口验证用户身份
+    成功时返回 200 并在响应头中设置用户信息
+    """
+    if not authorization:
+        response.status_code = 401
+        return {"error": "No authorization header"}
+    
+    # 提取 Token（只去掉开头的 Bearer 前缀）
+    token = authorization.removeprefix("Bearer ").strip()
+    if not token:
+        response.status_code = 401
+        return {"error": "Invalid token format"}
+    
+    # 解析 Token
+    token_data = await verify_access_token(token, redis)
+    if not token_data:
+        response.status_code = 401
+        return {"error": "Invalid or expired token"}
+    
+    # 设置响应头（供 Nginx 转发给后端服务）
+    # 注意：HTTP 头只支持 ASCII，中文需要 URL 编码（纯 ASCII 字母数字无需编码）
+    username = token_data.username
+    response.headers["X-User-Id"] = str(token_data.user_id)
+    response.headers["X-Username"] = (
+        username if username.isascii() and username.isalnum() else quote(username, safe='')
+    )
+    response.headers["X-User-Roles"] = ",".join(token_data.roles)
+    
+    return TokenVerifyResponse(
+        user_id=token_data.user_id,
+        username=token_data.username,
+        roles=token_data.roles,
+    )
+
+
+# ==================== 健康检查（放在路径参数路由之前） ====================
 
 @router.get("/health", summary="健康检查")
 async def health_check():
@@ -55,23 +113,26 @@ async def readiness_check():
 
 def get_auth_service(
     db: AsyncSession = Depends(get_db),
+    redis: RedisClient = Depends(get_redis),
 ) -> AuthService:
     """获取认证服务实例"""
-    return AuthService(db, redis=None)
+    return AuthService(db, redis=redis)
 
 
 def get_user_service(
     db: AsyncSession = Depends(get_db),
+    redis: RedisClient = Depends(get_redis),
 ) -> UserService:
     """获取用户服务实例"""
-    return UserService(db, kafka=None)
+    return UserService(db, kafka=None, redis=redis)
 
 
 def get_role_service(
     db: AsyncSession = Depends(get_db),
+    redis: RedisClient = Depends(get_redis),
 ) -> RoleService:
     """获取角色服务实例"""
-    return RoleService(db)
+    return RoleService(db, redis)
 
 
 def get_org_service(
@@ -90,52 +151,10 @@ def get_audit_log_service(
 
 def get_permission_service(
     db: AsyncSession = Depends(get_db),
+    redis: RedisClient = Depends(get_redis),
 ) -> PermissionService:
     """获取权限服务实例"""
-    return PermissionService(db)
-
-
-async def enrich_user_roles(user, db: AsyncSession) -> UserResponse:
-    """丰富用户角色信息"""
-    from sqlalchemy import select
-    from sqlalchemy.orm import selectinload
-    from .models import Role, UserRole
-    
-    # 直接查询用户的角色（避免懒加载问题）
-    user_roles_result = await db.execute(
-        select(UserRole).where(UserRole.user_id == user.id)
-    )
-    user_roles = user_roles_result.scalars().all()
-    role_codes = [r.role_code for r in user_roles]
-    
-    # 查询角色详情
-    roles_data = []
-    if role_codes:
-        result = await db.execute(
-            select(Role).where(Role.code.in_(role_codes))
-        )
-        roles = result.scalars().all()
-        roles_data = [
-            UserRoleResponse(
-                id=role.id,
-                code=role.code,
-                name=role.name,
-                description=role.description
-            )
-            for role in roles
-        ]
-    
-    return UserResponse(
-        id=user.id,
-        username=user.username,
-        name=user.name,
-        mobile=user.mobile,
-        email=user.email,
-        org_id=user.org_id,
-        status=user.status,
-        created_at=user.created_at,
-        roles=roles_data
-    )
+    return PermissionService(db, redis)
 
 
 # ==================== 认证接口 ====================
@@ -152,67 +171,35 @@ async def login(
     - **password**: 密码
     """
     result = await service.login(data)
-    return Result.ok(data=result)
+    return orjson_response(Result.ok(data=result))
 
 
 @router.post("/logout", response_model=Result, summary="用户注销")
 async def logout(
     user: CurrentUser = Depends(get_current_user),
     service: AuthService = Depends(get_auth_service),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
 ):
     """用户注销，使 Token 失效"""
-    await service.logout(user.user_id)
+    token = credentials.credentials if credentials else None
+    await service.logout(user.user_id, token=token)
     return Result.ok(message="Logged out successfully")
 
 
-@router.get("/verify", summary="验证 Token（供 Nginx auth_request 使用）")
-async def verify_token(
-    response: Response,
-    authorization: str = Header(None),
-    db: AsyncSession = Depends(get_db),
-):
-    """
-    验证 Token 有效性
-    
-    Nginx auth_request 调用此接口验证用户身份
-    成功时返回 200 并在响应头中设置用户信息
-    """
-    if not authorization:
-        response.status_code = 401
-        return {"error": "No authorization header"}
-    
-    # 提取 Token
-    token = authorization.replace("Bearer ", "").strip()
-    if not token:
-        response.status_code = 401
-        return {"error": "Invalid token format"}
-    
-    # 解析 Token
-    token_data = decode_token(token)
-    if not token_data:
-        response.status_code = 401
-        return {"error": "Invalid or expired token"}
-    
-    # 设置响应头（供 Nginx 转发给后端服务）
-    # 注意：HTTP 头只支持 ASCII，中文需要 URL 编码
-    from urllib.parse import quote
-    response.headers["X-User-Id"] = str(token_data.user_id)
-    response.headers["X-Username"] = quote(token_data.username, safe='')
-    response.headers["X-User-Roles"] = ",".join(token_data.roles)
-    
-    return TokenVerifyResponse(
-        user_id=token_data.user_id,
-        username=token_data.username,
-        roles=token_data.roles,
-    )
+# ==================== 用户接口 ====================
 
+@router.get("/me", response_model=Result[UserResponse], summary="获取当前用户信息")
+async def get_current_user_info(
+    user: CurrentUser = Depends(get_current_user),
+    service: UserService = Depends(get_user_service),
+):
+    """获取当前登录用户的详细信息"""
+    return orjson_response(Result.ok(data=await service.get_user_response(user.user_id)))
 
-# ==================== 用户接口 ====================
 
 @router.post("/create", response_model=Result[UserResponse], summary="创建用户")
 async def create_user(
     data: UserCreate,
-    db: AsyncSession = Depends(get_db),
     service: UserService = Depends(get_user_service),
     user: CurrentUser = Depends(require_roles("ADMIN")),
 ):
@@ -224,20 +211,7 @@ async def create_user(
     - **roles**: 角色编码列表
     """
     new_user = await service.create_user(data, operator=user.username)
-    response = await enrich_user_roles(new_user, db)
-    return Result.ok(data=response)
-
-
-@router.get("/me", response_model=Result[UserResponse], summary="获取当前用户信息")
-async def get_current_user_info(
-    db: AsyncSession = Depends(get_db),
-    user: CurrentUser = Depends(get_current_user),
-    service: UserService = Depends(get_user_service),
-):
-    """获取当前登录用户的详细信息"""
-    user_info = await service.get_user(user.user_id)
-    response = await enrich_user_roles(user_info, db)
-    return Result.ok(data=response)
+    return orjson_response(Result.ok(data=new_user))
 
 
 @router.get("/list", response_model=Result[PageResult[UserResponse]], summary="用户列表")
@@ -247,14 +221,10 @@ async def list_users(
     status: int = Query(None, ge=0, le=1, description="状态"),
     page: int = Query(1, ge=1, description="页码"),
     size: int = Query(20, ge=1, le=100, description="每页数量"),
-    db: AsyncSession = Depends(get_db),
     service: UserService = Depends(get_user_service),
     user: CurrentUser = Depends(get_current_user),
 ):
     """分页查询用户列表"""
-    from sqlalchemy import select
-    from .models import Role
-    
     query = UserQuery(
         keyword=keyword,
         org_id=org_id,
@@ -263,44 +233,12 @@ async def list_users(
         size=size,
     )
     result = await service.list_users(query)
-    
-    # 获取所有角色信息
-    role_result = await db.execute(select(Role))
-    all_roles = {r.code: r for r in role_result.scalars().all()}
-    
-    # 丰富角色信息
-    enriched_items = []
-    for item in result.items:
-        roles_data = []
-        for role_ref in item.roles:
-            role = all_roles.get(role_ref.role_code if hasattr(role_ref, 'role_code') else role_ref.code)
-            if role:
-                roles_data.append(UserRoleResponse(
-                    id=role.id,
-                    code=role.code,
-                    name=role.name,
-                    description=role.description
-                ))
-        enriched_items.append(UserResponse(
-            id=item.id,
-            username=item.username,
-            name=item.name,
-            mobile=item.mobile,
-            email=item.email,
-            org_id=item.org_id,
-            status=item.status,
-            created_at=item.created_at,
-            roles=roles_data
-        ))
-    
-    result.items = enriched_items
-    return Result.ok(data=result)
+    return orjson_response(Result.ok(data=result))
 
 
 @router.post("/role/assign", response_model=Result[UserResponse], summary="分配角色")
 async def assign_roles(
     request: RoleAssignRequest,
-    db: AsyncSession = Depends(get_db),
     service: UserService = Depends(get_user_service),
     user: CurrentUser = Depends(require_roles("ADMIN")),
 ):
@@ -310,8 +248,7 @@ async def assign_roles(
     会替换用户现有的所有角色
     """
     updated_user = await service.assign_roles(request)
-    response = await enrich_user_roles(updated_user, db)
-    return Result.ok(data=response)
+    return Result.ok(data=UserResponse.model_validate(updated_user))
 
 
 @router.post("/password/change", response_model=Result, summary="修改密码")
@@ -345,7 +282,7 @@ async def list_roles(
 ):
     """获取所有角色列表"""
     roles = await service.list_roles()
-    return Result.ok(data=[RoleResponse.model_validate(r) for r in roles])
+    return orjson_response(Result.ok(data=roles))
 
 
 @router.post("/role/create", response_model=Result[RoleResponse], summary="创建角色")
@@ -394,7 +331,7 @@ async def list_orgs(
 ):
     """获取组织列表"""
     orgs = await service.list_orgs(type=type, parent_id=parent_id, status=status)
-    return Result.ok(data=[OrgResponse.model_validate(o) for o in orgs])
+    return orjson_response(Result.ok(data=ORG_LIST_ADAPTER.validate_python(orgs, from_attributes=True)))
 
 
 @router.get("/org/{org_id}", response_model=Result[OrgResponse], summary="组织详情")
@@ -462,7 +399,7 @@ async def list_audit_logs(
         page=page,
         size=size
     )
-    return Result.ok(data=result)
+    return orjson_response(Result.ok(data=result))
 
 
 # ==================== 权限接口 ====================
@@ -474,7 +411,7 @@ async def list_permissions(
 ):
     """获取所有权限点"""
     permissions = await service.list_permissions()
-    return Result.ok(data=[PermissionResponse.model_validate(p) for p in permissions])
+    return orjson_response(Result.ok(data=permissions))
 
 
 @router.get("/permission/role/{role_id}", response_model=Result[list[str]], summary="角色权限")
@@ -507,8 +444,7 @@ async def get_my_permissions(
     """获取当前用户的权限点"""
     # ADMIN 拥有所有权限
     if "ADMIN" in user.roles:
-        permissions = await service.list_permissions()
-        return Result.ok(data=[p.code for p in permissions])
+        return Result.ok(data=list(await service.list_permission_codes()))
     
     permissions = await service.get_user_permissions(user.user_id)
     return Result.ok(data=list(permissions))
@@ -519,28 +455,23 @@ async def get_my_permissions(
 @router.get("/{user_id}", response_model=Result[UserResponse], summary="获取用户详情")
 async def get_user(
     user_id: int,
-    db: AsyncSession = Depends(get_db),
     service: UserService = Depends(get_user_service),
     user: CurrentUser = Depends(get_current_user),
 ):
     """根据ID获取用户详情"""
-    user_info = await service.get_user(user_id)
-    response = await enrich_user_roles(user_info, db)
-    return Result.ok(data=response)
+    return orjson_response(Result.ok(data=await service.get_user_response(user_id)))
 
 
 @router.put("/{user_id}", response_model=Result[UserResponse], summary="更新用户")
 async def update_user(
     user_id: int,
     data: UserUpdate,
-    db: AsyncSession = Depends(get_db),
     service: UserService = Depends(get_user_service),
     user: CurrentUser = Depends(require_roles("ADMIN")),
 ):
     """更新用户信息（需要管理员权限）"""
     updated_user = await service.update_user(user_id, data, operator=user.username)
-    response = await enrich_user_roles(updated_user, db)
-    return Result.ok(data=response)
+    return orjson_response(Result.ok(data=updated_user))
 
 
 @router.delete("/{user_id}", response_model=Result, summary="删除用户")
@@ -8,13 +8,17 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 from erp_common.config import settings
-from erp_common.database import close_db, init_db
+from erp_common.database import close_db, init_db, warmup_db
 from erp_common.exceptions import BusinessError
 from erp_common.schemas.base import Result
+from erp_common.utils.jwt_utils import ensure_native_password_backends
+from erp_common.utils.redis_utils import close_redis, init_redis
 
 from .api import router
+from .service import shutdown_password_executor
 
 # 配置日志
 logging.basicConfig(
@@ -32,13 +36,22 @@ async def lifespan(app: FastAPI):
     
     # 初始化数据库
     await init_db()
+    await warmup_db()
     logger.info("Database initialized")
     
+    # 初始化 Redis（角色/权限字典缓存）
+    await init_redis()
+    
+    # 密码哈希使用原生后端（登录、创建用户的主要 CPU 开销）
+    ensure_native_password_backends()
+    
     yield
     
     # 关闭时
     logger.info("Shutting down User Service...")
+    await close_redis()
     await close_db()
+    shutdown_password_executor()
     logger.info("User Service stopped")
 
 
@@ -92,6 +105,21 @@ async def validation_error_handler(request: Request, exc: RequestValidationError
     )
 
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """连接池耗尽：快速返回 503，由客户端/网关重试，避免请求在池上排队"""
+    logger.warning(f"Database pool exhausted: {exc}")
+    
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content=Result.fail(
+            message="Service busy, please retry",
+            code="SERVICE_BUSY",
+        ).model_dump(mode='json'),
+    )
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """全局异常处理"""
@@ -5,7 +5,7 @@
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import BigInteger, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from erp_common.database import Base
@@ -51,6 +51,14 @@ class User(Base):
     # 关系
     org: Mapped[Optional["Org"]] = relationship("Org", back_populates="users")
     roles: Mapped[List["UserRole"]] = relationship("UserRole", back_populates="user", lazy="selectin")
+    
+    __table_args__ = (
+        # 关键词搜索（用户名/姓名/手机号任意位置匹配），ngram 分词支持中文
+        Index(
+            "ft_user_search", "username", "name", "mobile",
+            mysql_prefix="FULLTEXT", mysql_with_parser="ngram",
+        ),
+    )
 
 
 class Role(Base):
@@ -86,10 +94,25 @@ class UserRole(Base):
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("user.id"), nullable=False)
     role_code: Mapped[str] = mapped_column(String(50), nullable=False)
+    role_id: Mapped[Optional[int]] = mapped_column(BigInteger, comment="角色ID（分配时按 role_code 填充，关联查询走整型主键）")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     
     # 关系
     user: Mapped["User"] = relationship("User", back_populates="roles")
+    role_obj: Mapped[Optional["Role"]] = relationship(
+        "Role",
+        primaryjoin="UserRole.role_id == Role.id",
+        foreign_keys=[role_id],
+        viewonly=True,
+        lazy="joined",
+    )
+    
+    __table_args__ = (
+        # 与 init.sql 的 uk_user_role 一致：防止重复分配，同时承担按 user_id 前缀查询的索引
+        UniqueConstraint("user_id", "role_code", name="uk_user_role"),
+        # 按角色关联权限、统计使用人数（删除角色前检查）
+        Index("idx_user_role_role_id", "role_id"),
+    )
 
 
 class RolePermission(Base):
@@ -115,3 +138,9 @@ class AuditLog(Base):
     detail: Mapped[Optional[str]] = mapped_column(Text, comment="操作详情")
     ip_address: Mapped[Optional[str]] = mapped_column(String(50), comment="IP地址")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        # 与列表查询形状一致：等值过滤列在前，created_at 在后直接满足倒序排序
+        Index("idx_audit_user_created", "user_id", "created_at"),
+        Index("idx_audit_action_resource_created", "action", "resource_type", "created_at"),
+    )
@@ -3,22 +3,49 @@
 """
 
 from datetime import datetime
-from typing import List, Optional
+from functools import lru_cache
+from typing import Annotated, List, Optional
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, TypeAdapter, field_validator
 
 from erp_common.schemas.base import PageQuery
 
 
+class SchemaModel(BaseModel):
+    """
+    用户中心 Schema 基类
+    
+    defer_build：校验器/序列化器推迟到首次使用时构建，冷门接口的模型不占启动时间和内存
+    """
+    model_config = ConfigDict(defer_build=True)
+
+
+class ResponseModel(SchemaModel):
+    """
+    响应 Schema 基类
+    
+    from_attributes：可直接由 ORM 对象构建；frozen：响应只读，实例可在请求间复用
+    """
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+# 邮箱字段：共用一个类型别名，正则只编译一次（不依赖 email-validator）；
+# 前端表单未填邮箱时提交空字符串，按未填写（None）处理
+EmailField = Annotated[
+    Optional[Annotated[str, Field(pattern=r"^[^@\s]+@[^@\s]+\.[^@\s]+$", max_length=100)]],
+    BeforeValidator(lambda v: v or None),
+]
+
+
 # ========== 登录相关 ==========
 
-class LoginRequest(BaseModel):
+class LoginRequest(SchemaModel):
     """登录请求"""
     username: str = Field(..., min_length=1, max_length=50)
     password: str = Field(..., min_length=6, max_length=100)
 
 
-class LoginResponse(BaseModel):
+class LoginResponse(SchemaModel):
     """登录响应"""
     access_token: str
     token_type: str = "bearer"
@@ -26,7 +53,7 @@ class LoginResponse(BaseModel):
     user: "UserBrief"
 
 
-class TokenVerifyResponse(BaseModel):
+class TokenVerifyResponse(SchemaModel):
     """Token 验证响应（用于 Nginx auth_request）"""
     user_id: int
     username: str
@@ -35,50 +62,58 @@ class TokenVerifyResponse(BaseModel):
 
 # ========== 用户相关 ==========
 
-class UserCreate(BaseModel):
+class UserCreate(SchemaModel):
     """创建用户请求"""
     username: str = Field(..., min_length=3, max_length=50, description="用户名")
     password: str = Field(..., min_length=6, max_length=100, description="密码")
     name: Optional[str] = Field(None, max_length=50, description="姓名")
     mobile: Optional[str] = Field(None, max_length=20, description="手机号")
-    email: Optional[str] = Field(None, description="邮箱")
+    email: Optional[EmailField] = Field(None, description="邮箱")
     org_id: Optional[int] = Field(None, description="所属组织ID")
     roles: List[str] = Field(default_factory=list, description="角色编码列表")
 
 
-class UserUpdate(BaseModel):
+class UserUpdate(SchemaModel):
     """更新用户请求"""
     name: Optional[str] = Field(None, max_length=50)
     mobile: Optional[str] = Field(None, max_length=20)
-    email: Optional[str] = None
+    email: Optional[EmailField] = None
     org_id: Optional[int] = None
     status: Optional[int] = Field(None, ge=0, le=1)
 
 
-class PasswordChange(BaseModel):
+class PasswordChange(SchemaModel):
     """修改密码请求"""
     old_password: str = Field(..., min_length=6)
     new_password: str = Field(..., min_length=6, max_length=100)
 
 
-class PasswordReset(BaseModel):
+class PasswordReset(SchemaModel):
     """重置密码请求（管理员操作）"""
     user_id: int = Field(..., description="用户ID")
     new_password: str = Field(..., min_length=6, max_length=100, description="新密码")
 
 
-class UserRoleResponse(BaseModel):
-    """用户角色响应"""
+class UserRoleResponse(ResponseModel):
+    """用户角色响应（不可变，同一角色的实例在响应间复用）"""
     id: int
     code: str
     name: str
     description: Optional[str] = None
-    
-    class Config:
-        from_attributes = True
 
 
-class UserResponse(BaseModel):
+@lru_cache(maxsize=256)
+def build_user_role_response(
+    role_id: int,
+    code: str,
+    name: str,
+    description: Optional[str],
+) -> UserRoleResponse:
+    """按角色内容缓存 UserRoleResponse，角色信息变化时自然生成新的缓存项"""
+    return UserRoleResponse(id=role_id, code=code, name=name, description=description)
+
+
+class UserResponse(ResponseModel):
     """用户响应"""
     id: int
     username: str
@@ -90,19 +125,30 @@ class UserResponse(BaseModel):
     created_at: datetime
     roles: List[UserRoleResponse] = []
     
-    class Config:
-        from_attributes = True
-
-
-class UserBrief(BaseModel):
+    @field_validator("roles", mode="before")
+    @classmethod
+    def unwrap_user_roles(cls, value):
+        """ORM 的 UserRole 关联行展开为其关联的角色，角色已不存在的跳过"""
+        roles = []
+        for item in value:
+            role = getattr(item, "role_obj", item)
+            if role is None:
+                continue
+            if isinstance(role, (dict, UserRoleResponse)):
+                roles.append(role)
+            else:
+                roles.append(build_user_role_response(
+                    role.id, role.code, role.name, role.description
+                ))
+        return roles
+
+
+class UserBrief(ResponseModel):
     """用户简要信息"""
     id: int
     username: str
     name: Optional[str] = None
     roles: List[str] = []
-    
-    class Config:
-        from_attributes = True
 
 
 class UserQuery(PageQuery):
@@ -111,48 +157,42 @@ class UserQuery(PageQuery):
     org_id: Optional[int] = Field(None, description="组织ID")
     status: Optional[int] = Field(None, ge=0, le=1, description="状态")
     role: Optional[str] = Field(None, description="角色编码")
+    
+    model_config = ConfigDict(defer_build=True)
 
 
 # ========== 角色相关 ==========
 
-class RoleAssignRequest(BaseModel):
+class RoleAssignRequest(SchemaModel):
     """角色分配请求"""
     user_id: int
     roles: List[str] = Field(..., description="角色编码列表")
 
 
-class RoleCreate(BaseModel):
+class RoleCreate(SchemaModel):
     """创建角色请求"""
     code: str = Field(..., min_length=1, max_length=50)
     name: str = Field(..., min_length=1, max_length=100)
     description: Optional[str] = Field(None, max_length=500)
 
 
-class RoleUpdate(BaseModel):
+class RoleUpdate(SchemaModel):
     """更新角色请求"""
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     description: Optional[str] = Field(None, max_length=500)
 
 
-class RoleQuery(PageQuery):
-    """角色查询条件"""
-    keyword: Optional[str] = Field(None, description="关键词搜索")
-
-
-class RoleResponse(BaseModel):
+class RoleResponse(ResponseModel):
     """角色响应"""
     id: int
     code: str
     name: str
     description: Optional[str] = None
-    
-    class Config:
-        from_attributes = True
 
 
 # ========== 组织相关 ==========
 
-class OrgCreate(BaseModel):
+class OrgCreate(SchemaModel):
     """创建组织请求"""
     code: str = Field(..., min_length=1, max_length=32)
     name: str = Field(..., min_length=1, max_length=200)
@@ -160,7 +200,7 @@ class OrgCreate(BaseModel):
     parent_id: int = 0
 
 
-class OrgUpdate(BaseModel):
+class OrgUpdate(SchemaModel):
     """更新组织请求"""
     name: Optional[str] = Field(None, min_length=1, max_length=200)
     type: Optional[str] = Field(None, description="类型")
@@ -168,15 +208,7 @@ class OrgUpdate(BaseModel):
     status: Optional[int] = Field(None, ge=0, le=1)
 
 
-class OrgQuery(PageQuery):
-    """组织查询条件"""
-    keyword: Optional[str] = Field(None, description="关键词搜索")
-    type: Optional[str] = Field(None, description="组织类型")
-    parent_id: Optional[int] = Field(None, description="父级ID")
-    status: Optional[int] = Field(None, ge=0, le=1)
-
-
-class OrgResponse(BaseModel):
+class OrgResponse(ResponseModel):
     """组织响应"""
     id: int
     code: str
@@ -185,14 +217,11 @@ class OrgResponse(BaseModel):
     parent_id: int
     status: int
     created_at: Optional[datetime] = None
-    
-    class Config:
-        from_attributes = True
 
 
 # ========== 操作日志相关 ==========
 
-class AuditLogResponse(BaseModel):
+class AuditLogResponse(ResponseModel):
     """操作日志响应"""
     id: int
     user_id: int
@@ -203,9 +232,6 @@ class AuditLogResponse(BaseModel):
     detail: Optional[str] = None
     ip_address: Optional[str] = None
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
 
 
 class AuditLogQuery(PageQuery):
@@ -215,27 +241,32 @@ class AuditLogQuery(PageQuery):
     resource_type: Optional[str] = Field(None, description="资源类型")
     start_time: Optional[datetime] = Field(None, description="开始时间")
     end_time: Optional[datetime] = Field(None, description="结束时间")
+    
+    model_config = ConfigDict(defer_build=True)
 
 
 # ========== 权限相关 ==========
 
-class PermissionResponse(BaseModel):
+class PermissionResponse(ResponseModel):
     """权限响应"""
     id: int
     code: str
     name: str
     resource: Optional[str] = None
     action: Optional[str] = None
-    
-    class Config:
-        from_attributes = True
 
 
-class RolePermissionAssign(BaseModel):
+class RolePermissionAssign(SchemaModel):
     """角色权限分配请求"""
     role_id: int
     permission_codes: List[str] = Field(..., description="权限编码列表")
 
 
-# 解决循环引用
-LoginResponse.model_rebuild()
+# ========== 列表校验器 ==========
+# 模块级复用同一个适配器，整页数据一次性校验，避免逐行调用 model_validate（同样推迟到首次使用时构建）
+
+_DEFERRED = ConfigDict(defer_build=True)
+
+ROLE_LIST_ADAPTER = TypeAdapter(List[RoleResponse], config=_DEFERRED)
+ORG_LIST_ADAPTER = TypeAdapter(List[OrgResponse], config=_DEFERRED)
+PERMISSION_LIST_ADAPTER = TypeAdapter(List[PermissionResponse], config=_DEFERRED)
@@ -2,11 +2,22 @@
 用户中心 - 业务服务层
 """
 
+import asyncio
+import hashlib
+import hmac
 import logging
-from typing import List, Optional
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
 
-from sqlalchemy import func, or_, select, delete
+import orjson
+from sqlalchemy import JSON, delete, exists, func, insert, lambda_stmt, literal, or_, select, update
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload, raiseload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from erp_common.config import settings
 from erp_common.exceptions import (
@@ -18,8 +29,11 @@ from erp_common.exceptions import (
 from erp_common.schemas.base import PageResult
 from erp_common.schemas.events import UserCreatedEvent, UserUpdatedEvent
 from erp_common.utils.jwt_utils import (
+    TokenData,
     create_access_token,
+    decode_token,
     get_password_hash,
+    password_needs_rehash,
     verify_password,
 )
 from erp_common.utils.kafka_utils import KafkaProducer, KafkaTopics
@@ -27,18 +41,335 @@ from erp_common.utils.redis_utils import RedisClient
 
 from .models import Org, Role, User, UserRole, AuditLog, Permission, RolePermission
 from .schemas import (
+    PERMISSION_LIST_ADAPTER,
+    ROLE_LIST_ADAPTER,
+    AuditLogResponse,
     LoginRequest,
     LoginResponse,
+    PermissionResponse,
     RoleAssignRequest,
+    RoleResponse,
     UserBrief,
     UserCreate,
     UserQuery,
     UserResponse,
     UserUpdate,
+    build_user_role_response,
 )
 
 logger = logging.getLogger(__name__)
 
+# 角色、权限字典表很小且极少变更，缓存到 Redis（短 TTL 兜底一致性）
+ROLE_LIST_CACHE_KEY = "user:roles:all"
+PERMISSION_LIST_CACHE_KEY = "user:permissions:all"
+LOOKUP_CACHE_TTL = 60
+# 角色只由管理员接口修改且变更后主动失效，可用更长的 TTL
+ROLE_CACHE_TTL = 300
+
+# ADMIN 拥有全部权限点：进程内缓存权限编码（时间戳为过期时刻），分配权限时清空
+_admin_permission_codes: Optional[Tuple[Tuple[str, ...], float]] = None
+
+# Token 有效期（秒），配置启动后不变
+JWT_EXPIRE_SECONDS = settings.jwt_expire_minutes * 60
+
+# 已验签的 Token 缓存（网关每个请求都会调用 /verify）
+TOKEN_CACHE_PREFIX = "tok:"
+TOKEN_REVOKED = "REVOKED"
+TOKEN_CACHE_SKEW = 5
+
+# 登录用户信息缓存（按用户名），TTL 较短以兜底账号停用等变更
+LOGIN_USER_CACHE_PREFIX = "user:uname:"
+LOGIN_USER_CACHE_TTL = 60
+
+# 用户关键词搜索的全文索引分词长度（MySQL ngram_token_size 默认值）
+NGRAM_TOKEN_SIZE = 2
+
+
+# 密码哈希专用线程池（argon2/bcrypt 的 C 实现计算期间释放 GIL，多个线程可并行占满多核），首次使用时创建
+_password_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_password_executor() -> ThreadPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            thread_name_prefix="password-hash",
+        )
+    return _password_executor
+
+
+async def hash_password(password: str) -> str:
+    """生成密码哈希（在密码哈希线程池中执行）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_executor(), get_password_hash, password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（在密码哈希线程池中执行）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_password_executor(), verify_password, plain_password, hashed_password
+    )
+
+
+# 近期验证通过的密码（键为 HMAC 摘要，值为过期时刻），同一用户短时间内重复登录跳过哈希计算；
+# 只缓存验证成功的结果，键包含存储的哈希，修改密码后旧缓存自然失效
+VERIFIED_PASSWORD_CACHE_SIZE = 10000
+VERIFIED_PASSWORD_CACHE_TTL = 60
+_verified_passwords: Dict[bytes, float] = {}
+
+
+def _verified_password_key(user_id: int, plain_password: str, hashed_password: str) -> bytes:
+    return hmac.new(
+        settings.jwt_secret_key.encode(),
+        user_id.to_bytes(8, "big") + hashed_password.encode() + plain_password.encode(),
+        hashlib.sha256,
+    ).digest()
+
+
+async def check_user_password(user_id: int, plain_password: str, hashed_password: str) -> bool:
+    """验证用户登录密码（命中近期验证缓存时不再计算哈希）"""
+    key = _verified_password_key(user_id, plain_password, hashed_password)
+    now = time.monotonic()
+    expires_at = _verified_passwords.get(key)
+    if expires_at is not None:
+        if expires_at > now:
+            return True
+        del _verified_passwords[key]
+    
+    if not await check_password(plain_password, hashed_password):
+        return False
+    
+    if len(_verified_passwords) >= VERIFIED_PASSWORD_CACHE_SIZE:
+        # 字典按插入顺序，淘汰最早写入的一项
+        del _verified_passwords[next(iter(_verified_passwords))]
+    _verified_passwords[key] = now + VERIFIED_PASSWORD_CACHE_TTL
+    return True
+
+
+# 用户不存在时参与验证的哈希（首次使用时生成）
+_dummy_password_hash: Optional[str] = None
+
+
+async def check_dummy_password(plain_password: str) -> None:
+    """对固定哈希验证一次密码，使不存在的用户名与密码错误耗时相近"""
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = await hash_password("")
+    await check_password(plain_password, _dummy_password_hash)
+
+
+def shutdown_password_executor() -> None:
+    """关闭密码哈希线程池（应用关闭时调用）"""
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+
+# 后台任务（持有引用，避免任务执行完之前被回收）
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Background task failed: {task.exception()}")
+
+
+def run_in_background(coro) -> None:
+    """后台执行不影响响应结果的写操作（如缓存写入），异常只记录日志"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+
+
+def token_cache_key(token: str) -> str:
+    """Token 缓存键（不直接存明文 Token）"""
+    return TOKEN_CACHE_PREFIX + hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def _token_remaining_seconds(token_data: TokenData) -> int:
+    """Token 剩余有效秒数"""
+    if token_data.exp is None:
+        return 0
+    return int(token_data.exp.timestamp() - time.time())
+
+
+async def verify_access_token(
+    token: str,
+    redis: Optional[RedisClient] = None
+) -> Optional[TokenData]:
+    """
+    校验访问令牌
+    
+    验签通过的令牌按剩余有效期缓存到 Redis，命中时跳过验签；
+    注销后的令牌在同一个键上标记为 REVOKED，直到原本的过期时间。
+    网关每个请求都经过这里，Redis 不可用时退化为直接验签（期间无法识别已注销的令牌），
+    缓存写入在后台执行，失败只记录日志
+    
+    Returns:
+        TokenData 或 None（无效、过期或已注销）
+    """
+    if redis is None:
+        return decode_token(token)
+    
+    cache_key = token_cache_key(token)
+    try:
+        cached = await redis.get(cache_key)
+    except Exception as e:
+        logger.warning(f"Token cache unavailable, verifying signature only: {e}")
+        return decode_token(token)
+    if cached == TOKEN_REVOKED:
+        return None
+    if cached:
+        return TokenData.model_validate_json(cached)
+    
+    token_data = decode_token(token)
+    if token_data is None:
+        return None
+    
+    ttl = _token_remaining_seconds(token_data) - TOKEN_CACHE_SKEW
+    if ttl > 0:
+        # nx：不覆盖并发注销写入的 REVOKED 标记；校验结果不依赖写入，后台执行
+        run_in_background(
+            redis.set(cache_key, token_data.model_dump_json(), expire=ttl, nx=True)
+        )
+    return token_data
+
+
+async def revoke_access_token(token: str, redis: RedisClient) -> None:
+    """注销令牌：标记为 REVOKED 直到其过期"""
+    token_data = decode_token(token)
+    if token_data is None:
+        return
+    
+    ttl = _token_remaining_seconds(token_data)
+    if ttl > 0:
+        await redis.set(token_cache_key(token), TOKEN_REVOKED, expire=ttl)
+
+
+async def cache_get(redis: Optional[RedisClient], key: str) -> Optional[str]:
+    """读取查询缓存，Redis 不可用时返回 None（调用方回退到数据库）"""
+    if not redis:
+        return None
+    try:
+        return await redis.get(key)
+    except Exception as e:
+        logger.warning(f"Cache read failed for {key}: {e}")
+        return None
+
+
+async def cache_set(redis: Optional[RedisClient], key: str, value: str, expire: int) -> None:
+    """写入查询缓存，失败只记录日志"""
+    if not redis:
+        return
+    try:
+        await redis.set(key, value, expire=expire)
+    except Exception as e:
+        logger.warning(f"Cache write failed for {key}: {e}")
+
+
+def login_user_cache_key(username: str) -> str:
+    """登录用户信息缓存键"""
+    return LOGIN_USER_CACHE_PREFIX + username
+
+
+async def invalidate_login_user(redis: Optional[RedisClient], username: str) -> None:
+    """
+    用户信息、密码、角色变更后清除登录缓存
+    
+    必须在事务提交后调用：提交前删除的话，并发登录会把旧的密码哈希、状态、角色重新写回缓存，
+    在整个 TTL 内旧密码仍可登录。失败只记录日志（变更已提交，缓存最多保留 TTL）
+    """
+    if not redis:
+        return
+    try:
+        await redis.delete(login_user_cache_key(username))
+    except Exception as e:
+        logger.warning(f"Failed to invalidate login cache for {username}: {e}")
+
+
+def user_keyword_condition(keyword: str):
+    """
+    用户关键词搜索条件（用户名/姓名/手机号任意位置匹配）
+    
+    走 ft_user_search 全文索引（ngram 分词）做短语匹配，效果等同于 LIKE '%关键词%' 但不扫全表；
+    短于 ngram 分词长度的关键词无法命中全文索引，仍用 LIKE
+    """
+    if len(keyword) < NGRAM_TOKEN_SIZE:
+        return or_(
+            User.username.contains(keyword),
+            User.name.contains(keyword),
+            User.mobile.contains(keyword),
+        )
+    
+    # 整体作为短语检索，去掉双引号避免破坏 BOOLEAN MODE 语法
+    phrase = '"%s"' % keyword.replace('"', " ")
+    return match(User.username, User.name, User.mobile, against=phrase).in_boolean_mode()
+
+
+def user_response_select():
+    """
+    构建 UserResponse 所需列的 Core 查询（不构建 ORM 对象）
+    
+    用户角色通过关联子查询聚合为 JSON 数组（只对结果行执行），一次往返即可得到角色详情；
+    无角色时为 NULL，由 user_response_from_row 转为空列表
+    """
+    roles_json = (
+        select(
+            func.json_arrayagg(
+                func.json_object(
+                    "id", Role.id,
+                    "code", Role.code,
+                    "name", Role.name,
+                    "description", Role.description,
+                ),
+                type_=JSON,
+            )
+        )
+        .select_from(UserRole)
+        .join(Role, Role.id == UserRole.role_id)
+        .where(UserRole.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+        .label("roles")
+    )
+    return select(
+        User.id,
+        User.username,
+        User.name,
+        User.mobile,
+        User.email,
+        User.org_id,
+        User.status,
+        User.created_at,
+        roles_json,
+    )
+
+
+def user_response_from_row(row) -> UserResponse:
+    """
+    由 user_response_select 的结果行直接构建 UserResponse
+    
+    数据来自数据库，用 model_construct 跳过校验；角色 JSON 中的每一项复用缓存的角色响应
+    """
+    return UserResponse.model_construct(
+        id=row.id,
+        username=row.username,
+        name=row.name,
+        mobile=row.mobile,
+        email=row.email,
+        org_id=row.org_id,
+        status=row.status,
+        created_at=row.created_at,
+        roles=[
+            build_user_role_response(r["id"], r["code"], r["name"], r["description"])
+            for r in row.roles or ()
+        ],
+    )
+
 
 class AuthService:
     """认证服务"""
@@ -61,66 +392,114 @@ class AuthService:
         Returns:
             登录响应（包含 Token）
         """
-        from sqlalchemy.orm import selectinload
         
-        # 1. 查询用户（预加载角色）
-        result = await self.db.execute(
-            select(User)
-            .options(selectinload(User.roles))
-            .where(User.username == data.username)
-        )
-        user = result.scalar_one_or_none()
+        # 1. 查询登录所需的用户信息（优先读取 Redis 缓存）
+        user = await self._get_login_user(data.username)
         
         if not user:
+            # 用户不存在时同样计算一次哈希，响应耗时不暴露用户名是否存在
+            await check_dummy_password(data.password)
             raise AuthenticationError("Invalid username or password")
         
-        # 2. 验证密码
-        if not verify_password(data.password, user.password):
+        # 2. 检查用户状态（先于验证密码，停用账号不消耗哈希计算；
+        #    未验证密码前不透露账号状态，返回与密码错误相同的提示）
+        if user["status"] != 1:
             raise AuthenticationError("Invalid username or password")
         
-        # 3. 检查用户状态
-        if user.status != 1:
-            raise AuthenticationError("User account is disabled")
+        # 3. 验证密码（密码哈希计算耗时，在专用线程池中执行，避免阻塞事件循环）
+        if not await check_user_password(user["id"], data.password, user["password"]):
+            raise AuthenticationError("Invalid username or password")
+        
+        # 4. 用户角色编码（同一列表同时用于生成 Token 和登录响应）
+        role_codes = user["roles"]
         
-        # 4. 获取用户角色
-        roles = [role.role_code for role in user.roles]
+        # 密码已验证通过：哈希算法或参数与当前配置不一致时用明文重算（bcrypt 平滑迁移到 Argon2id）
+        if password_needs_rehash(user["password"]):
+            await self.db.execute(
+                update(User)
+                .where(User.id == user["id"])
+                .values(password=await hash_password(data.password))
+            )
+            await self.db.commit()
+            await invalidate_login_user(self.redis, data.username)
         
         # 5. 生成 Token
         access_token = create_access_token(
-            user_id=user.id,
-            username=user.username,
-            roles=roles,
+            user_id=user["id"],
+            username=user["username"],
+            roles=role_codes,
         )
         
-        # 6. 存储 Token 到 Redis（可选，用于注销）
+        # 6. 存储 Token 到 Redis（可选，用于注销；响应不依赖写入结果，后台执行）
         if self.redis:
-            token_key = f"token:{user.id}"
-            await self.redis.set(
-                token_key, 
-                access_token, 
-                expire=settings.jwt_expire_minutes * 60
+            token_key = f"token:{user['id']}"
+            run_in_background(
+                self.redis.set(token_key, access_token, expire=JWT_EXPIRE_SECONDS)
             )
         
-        logger.info(f"User logged in: {user.username}")
+        logger.info(f"User logged in: {user['username']}")
         
-        return LoginResponse(
+        # 响应数据均由本方法生成，用 model_construct 跳过校验
+        return LoginResponse.model_construct(
             access_token=access_token,
             token_type="bearer",
-            expires_in=settings.jwt_expire_minutes * 60,
-            user=UserBrief(
-                id=user.id,
-                username=user.username,
-                name=user.name,
-                roles=roles,
+            expires_in=JWT_EXPIRE_SECONDS,
+            user=UserBrief.model_construct(
+                id=user["id"],
+                username=user["username"],
+                name=user["name"],
+                roles=role_codes,
             )
         )
     
-    async def logout(self, user_id: int) -> bool:
+    async def _get_login_user(self, username: str) -> Optional[dict]:
+        """
+        获取登录所需的用户信息（ID、用户名、姓名、密码哈希、状态、角色编码）
+        
+        按用户名缓存到 Redis（短 TTL），用户信息、密码、角色变更时清除；
+        Redis 不可用时直接查库
+        """
+        cache_key = login_user_cache_key(username)
+        cached = await cache_get(self.redis, cache_key)
+        if cached:
+            return orjson.loads(cached)
+        
+        # JOIN 预加载角色编码，一次往返；登录只需编码，不再关联角色表
+        result = await self.db.execute(lambda_stmt(
+            lambda: select(User)
+            .options(
+                joinedload(User.roles).raiseload(UserRole.role_obj),
+                raiseload("*"),
+            )
+            .where(User.username == username)
+        ))
+        user = result.unique().scalar_one_or_none()
+        if not user:
+            return None
+        
+        login_user = {
+            "id": user.id,
+            "username": user.username,
+            "name": user.name,
+            "password": user.password,
+            "status": user.status,
+            "roles": [role.role_code for role in user.roles],
+        }
+        if self.redis:
+            run_in_background(
+                self.redis.set(
+                    cache_key, orjson.dumps(login_user).decode(), expire=LOGIN_USER_CACHE_TTL
+                )
+            )
+        return login_user
+    
+    async def logout(self, user_id: int, token: Optional[str] = None) -> bool:
         """
         用户注销
         
         Args:
             user_id: 用户ID
+            token: 当前请求的 Token（注销后 /verify 不再放行）
         
         Returns:
             是否成功
@@ -128,6 +507,8 @@ class AuthService:
         if self.redis:
             token_key = f"token:{user_id}"
             await self.redis.delete(token_key)
+            if token:
+                await revoke_access_token(token, self.redis)
         
         logger.info(f"User logged out: {user_id}")
         return True
@@ -139,12 +520,14 @@ class UserService:
     def __init__(
         self, 
         db: AsyncSession,
-        kafka: Optional[KafkaProducer] = None
+        kafka: Optional[KafkaProducer] = None,
+        redis: Optional[RedisClient] = None
     ):
         self.db = db
         self.kafka = kafka
+        self.redis = redis
     
-    async def create_user(self, data: UserCreate, operator: str = None) -> User:
+    async def create_user(self, data: UserCreate, operator: str = None) -> UserResponse:
         """
         创建用户
         
@@ -153,19 +536,16 @@ class UserService:
             operator: 操作人
         
         Returns:
-            创建的用户对象
+            创建的用户响应（含角色详情）
         """
-        # 1. 检查用户名是否存在
-        existing = await self.db.execute(
-            select(User).where(User.username == data.username)
-        )
-        if existing.scalar_one_or_none():
+        # 1. 检查用户名是否存在（先于计算密码哈希，重复用户名快速失败）
+        if await self.db.scalar(select(exists().where(User.username == data.username))):
             raise ConflictError(f"Username '{data.username}' already exists")
         
         # 2. 创建用户
         user = User(
             username=data.username,
-            password=get_password_hash(data.password),
+            password=await hash_password(data.password),
             name=data.name,
             mobile=data.mobile,
             email=data.email,
@@ -173,16 +553,21 @@ class UserService:
             status=1,
         )
         self.db.add(user)
-        await self.db.flush()
+        try:
+            await self.db.flush()
+        except IntegrityError:
+            # 检查之后可能被并发创建了同名用户，由唯一索引兜底；
+            # 回滚后重新确认，其他约束冲突原样抛出
+            await self.db.rollback()
+            if await self.db.scalar(select(exists().where(User.username == data.username))):
+                raise ConflictError(f"Username '{data.username}' already exists") from None
+            raise
         
         # 3. 分配角色
-        for role_code in data.roles:
-            user_role = UserRole(user_id=user.id, role_code=role_code)
-            self.db.add(user_role)
-        
-        await self.db.flush()
+        await self._insert_user_roles(user.id, data.roles)
+        await self.db.commit()
         
-        # 4. 发布事件
+        # 4. 发布事件（提交成功后再发布，避免回滚的用户产生事件）
         if self.kafka:
             event = UserCreatedEvent(
                 aggregate_id=str(user.id),
@@ -196,13 +581,19 @@ class UserService:
             await self.kafka.send(KafkaTopics.USER_EVENTS, event)
         
         logger.info(f"User created: {user.username}")
-        return user
+        # 角色由 Core INSERT 写入，按只读路径直接查出响应（不再经 ORM 重新加载用户和角色）
+        return await self.get_user_response(user.id)
     
     async def get_user(self, user_id: int) -> User:
-        """获取用户详情"""
-        result = await self.db.execute(
-            select(User).where(User.id == user_id)
-        )
+        """
+        获取用户（不加载角色，用于改密码、删除、分配角色等写操作；
+        响应数据走 get_user_response）
+        """
+        result = await self.db.execute(lambda_stmt(
+            lambda: select(User)
+            .options(raiseload("*"))
+            .where(User.id == user_id)
+        ))
         user = result.scalar_one_or_none()
         
         if not user:
@@ -210,35 +601,40 @@ class UserService:
         
         return user
     
-    async def get_user_by_username(self, username: str) -> User:
-        """通过用户名获取用户"""
-        result = await self.db.execute(
-            select(User).where(User.username == username)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            raise NotFoundError("User", username)
+    async def get_user_response(self, user_id: int) -> UserResponse:
+        """获取用户详情响应（只读，Core 查询直接构建响应，不经过 ORM）"""
+        result = await self.db.execute(lambda_stmt(
+            lambda: user_response_select().where(User.id == user_id)
+        ))
+        row = result.one_or_none()
+        
+        if row is None:
+            raise NotFoundError("User", user_id)
         
-        return user
+        return user_response_from_row(row)
     
     async def update_user(
         self, 
         user_id: int, 
         data: UserUpdate,
         operator: str = None
-    ) -> User:
-        """更新用户"""
-        user = await self.get_user(user_id)
-        
-        # 更新字段
+    ) -> UserResponse:
+        """更新用户（直接 UPDATE 变更的字段，不加载 ORM 对象）"""
         update_data = data.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(user, field, value)
+        if update_data:
+            await self.db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(**update_data)
+                .execution_options(synchronize_session=False)
+            )
         
-        await self.db.flush()
+        # 用户不存在时这里抛出 NotFoundError
+        user = await self.get_user_response(user_id)
+        await self.db.commit()
+        await invalidate_login_user(self.redis, user.username)
         
-        # 发布事件
+        # 发布事件（同上，提交成功后再发布）
         if self.kafka:
             event = UserUpdatedEvent(
                 aggregate_id=str(user.id),
@@ -260,13 +656,7 @@ class UserService:
         conditions = []
         
         if query.keyword:
-            conditions.append(
-                or_(
-                    User.username.contains(query.keyword),
-                    User.name.contains(query.keyword),
-                    User.mobile.contains(query.keyword),
-                )
-            )
+            conditions.append(user_keyword_condition(query.keyword))
         
         if query.org_id is not None:
             conditions.append(User.org_id == query.org_id)
@@ -274,27 +664,34 @@ class UserService:
         if query.status is not None:
             conditions.append(User.status == query.status)
         
-        # 查询总数
-        count_stmt = select(func.count(User.id))
-        if conditions:
-            count_stmt = count_stmt.where(*conditions)
-        
-        total_result = await self.db.execute(count_stmt)
-        total = total_result.scalar()
-        
-        # 查询数据
-        stmt = select(User).order_by(User.id.desc())
+        # 查询数据（只取响应需要的列，当前页用户的角色在 SQL 中聚合为 JSON 数组），
+        # 总数通过窗口函数随分页数据一并返回
+        stmt = (
+            user_response_select()
+            .add_columns(func.count().over().label("total"))
+            .order_by(User.id.desc())
+        )
         if conditions:
             stmt = stmt.where(*conditions)
         stmt = stmt.offset(query.offset).limit(query.size)
         
-        result = await self.db.execute(stmt)
-        users = result.scalars().all()
-        
-        # 返回原始用户对象，由 api 层处理角色信息转换
-        return PageResult(
-            items=users,
-            total=total,
+        rows = (await self.db.execute(stmt)).all()
+        
+        if rows:
+            total = rows[0].total
+        elif query.page > 1:
+            # 页码超出范围时窗口函数无结果，单独统计总数
+            count_stmt = select(func.count(User.id))
+            if conditions:
+                count_stmt = count_stmt.where(*conditions)
+            total = await self.db.scalar(count_stmt)
+        else:
+            total = 0
+        
+        # 分页参数已在入口校验，数据来自数据库，直接构建分页结果
+        return PageResult.model_construct(
+            items=[user_response_from_row(row) for row in rows],
+            total=total or 0,
             page=query.page,
             size=query.size,
         )
@@ -309,26 +706,73 @@ class UserService:
         Returns:
             更新后的用户对象
         """
+        # 角色随后按差异更新并重新加载，这里不预先加载
         user = await self.get_user(request.user_id)
         
-        # 删除现有角色
-        await self.db.execute(
-            delete(UserRole).where(UserRole.user_id == user.id)
+        # 只对新旧角色的差异执行增删（重复分配相同角色时不产生写入）；
+        # 尚未关联到角色ID的行（分配时角色还不存在）一并重写
+        result = await self.db.execute(
+            select(UserRole.role_code, UserRole.role_id).where(UserRole.user_id == user.id)
         )
+        rows = result.all()
+        existing = {code for code, role_id in rows if role_id is not None}
+        has_unlinked = len(existing) < len(rows)
+        target = list(dict.fromkeys(request.roles))
+        to_remove = existing.difference(target)
+        to_add = [code for code in target if code not in existing]
+        
+        # 删除多余角色（角色集合随后整体重新加载，无需同步会话）
+        if to_remove or has_unlinked:
+            await self.db.execute(
+                delete(UserRole)
+                .where(
+                    UserRole.user_id == user.id,
+                    or_(UserRole.role_code.in_(to_remove), UserRole.role_id.is_(None)),
+                )
+                .execution_options(synchronize_session=False)
+            )
         
-        # 添加新角色
-        for role_code in request.roles:
-            user_role = UserRole(user_id=user.id, role_code=role_code)
-            self.db.add(user_role)
-        
-        await self.db.flush()
-        
-        # 重新加载用户
-        await self.db.refresh(user)
+        # 添加新角色（与上面的删除在同一事务内）
+        await self._insert_user_roles(user.id, to_add)
+        if to_remove or to_add or has_unlinked:
+            await self.db.commit()
+            await invalidate_login_user(self.redis, user.username)
         
         logger.info(f"Roles assigned to user {user.username}: {request.roles}")
+        
+        # 只加载角色集合（连同角色详情一次查询），用户行本身未变，无需重新查询
+        result = await self.db.execute(
+            select(UserRole)
+            .options(joinedload(UserRole.role_obj), raiseload("*"))
+            .where(UserRole.user_id == user.id)
+            .order_by(UserRole.id)
+        )
+        set_committed_value(user, "roles", list(result.scalars().all()))
         return user
     
+    async def _insert_user_roles(self, user_id: int, role_codes: List[str]) -> None:
+        """
+        写入用户角色关联（去重），一次查询按编码解析出角色ID，一条多行 INSERT 写入
+        
+        不存在的角色编码 role_id 为空，与原先只存编码时一样不会出现在角色详情中；
+        之后创建该编码的角色时回填 role_id（见 RoleService.create_role）
+        """
+        role_codes = list(dict.fromkeys(role_codes))
+        if not role_codes:
+            return
+        
+        result = await self.db.execute(
+            select(Role.code, Role.id).where(Role.code.in_(role_codes))
+        )
+        role_ids = dict(result.all())
+        
+        await self.db.execute(
+            insert(UserRole).values([
+                {"user_id": user_id, "role_code": code, "role_id": role_ids.get(code)}
+                for code in role_codes
+            ])
+        )
+    
     async def change_password(
         self, 
         user_id: int, 
@@ -339,13 +783,13 @@ class UserService:
         user = await self.get_user(user_id)
         
         # 验证旧密码
-        if not verify_password(old_password, user.password):
+        if not await check_password(old_password, user.password):
             raise ValidationError("Old password is incorrect")
         
         # 更新密码
-        user.password = get_password_hash(new_password)
-        await self.db.flush()
-        
+        user.password = await hash_password(new_password)
+        await self.db.commit()
+        await invalidate_login_user(self.redis, user.username)
         logger.info(f"Password changed for user: {user.username}")
         return True
     
@@ -354,9 +798,9 @@ class UserService:
         user = await self.get_user(user_id)
         
         # 直接更新密码
-        user.password = get_password_hash(new_password)
-        await self.db.flush()
-        
+        user.password = await hash_password(new_password)
+        await self.db.commit()
+        await invalidate_login_user(self.redis, user.username)
         logger.info(f"Password reset for user: {user.username}")
         return True
     
@@ -371,8 +815,8 @@ class UserService:
         
         # 删除用户
         await self.db.delete(user)
-        await self.db.flush()
-        
+        await self.db.commit()
+        await invalidate_login_user(self.redis, user.username)
         logger.info(f"User deleted: {user.username}")
         return True
 
@@ -380,28 +824,45 @@ class UserService:
 class RoleService:
     """角色服务"""
     
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, redis: Optional[RedisClient] = None):
         self.db = db
+        self.redis = redis
     
-    async def list_roles(self) -> List[Role]:
-        """获取所有角色"""
-        result = await self.db.execute(select(Role).order_by(Role.id))
-        return list(result.scalars().all())
-    
-    async def get_role(self, role_code: str) -> Role:
-        """获取角色"""
+    async def list_roles(self) -> List[RoleResponse]:
+        """获取所有角色（优先读取 Redis 缓存，Redis 不可用时直接查库）"""
+        cached = await cache_get(self.redis, ROLE_LIST_CACHE_KEY)
+        if cached:
+            return ROLE_LIST_ADAPTER.validate_json(cached)
+        
         result = await self.db.execute(
-            select(Role).where(Role.code == role_code)
+            select(Role).options(raiseload("*")).order_by(Role.id)
         )
-        role = result.scalar_one_or_none()
+        roles = ROLE_LIST_ADAPTER.validate_python(result.scalars().all(), from_attributes=True)
         
-        if not role:
-            raise NotFoundError("Role", role_code)
+        await cache_set(
+            self.redis,
+            ROLE_LIST_CACHE_KEY,
+            ROLE_LIST_ADAPTER.dump_json(roles).decode(),
+            expire=ROLE_CACHE_TTL
+        )
+        return roles
+    
+    async def _invalidate_role_cache(self) -> None:
+        """
+        角色变更后清除角色列表缓存
         
-        return role
+        必须在事务提交后调用：否则并发读可能在提交前把旧数据重新写回缓存，并保留整个 TTL。
+        失败只记录日志（变更已提交，缓存最多保留 TTL）
+        """
+        if not self.redis:
+            return
+        try:
+            await self.redis.delete(ROLE_LIST_CACHE_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate role cache: {e}")
     
     async def get_role_by_id(self, role_id: int) -> Role:
-        """根据ID获取角色"""
+        """根据ID获取角色（用于修改、删除，需要会话中的 ORM 对象，不走缓存）"""
         result = await self.db.execute(
             select(Role).where(Role.id == role_id)
         )
@@ -415,16 +876,23 @@ class RoleService:
     async def create_role(self, code: str, name: str, description: str = None) -> Role:
         """创建角色"""
         # 检查编码是否存在
-        existing = await self.db.execute(
-            select(Role).where(Role.code == code)
-        )
-        if existing.scalar_one_or_none():
+        if await self.db.scalar(select(exists().where(Role.code == code))):
             raise ConflictError(f"Role code '{code}' already exists")
         
         role = Role(code=code, name=name, description=description)
         self.db.add(role)
         await self.db.flush()
         
+        # 角色创建前已按编码分配给用户的关联补上角色ID，这些用户随即获得该角色的权限
+        await self.db.execute(
+            update(UserRole)
+            .where(UserRole.role_code == code, UserRole.role_id.is_(None))
+            .values(role_id=role.id)
+            .execution_options(synchronize_session=False)
+        )
+        
+        await self.db.commit()
+        await self._invalidate_role_cache()
         logger.info(f"Role created: {code}")
         return role
     
@@ -437,26 +905,37 @@ class RoleService:
         if description is not None:
             role.description = description
         
-        await self.db.flush()
+        await self.db.commit()
+        await self._invalidate_role_cache()
         logger.info(f"Role updated: {role.code}")
         return role
     
     async def delete_role(self, role_id: int) -> bool:
         """删除角色"""
-        role = await self.get_role_by_id(role_id)
-        
-        # 检查是否有用户使用该角色
-        user_count_result = await self.db.execute(
-            select(func.count(UserRole.id)).where(UserRole.role_code == role.code)
+        # 角色与使用该角色的用户数一次查询取回（按编码分配、尚未关联角色ID的也算在内）
+        result = await self.db.execute(
+            select(
+                Role,
+                select(func.count(UserRole.id))
+                .where(or_(UserRole.role_id == Role.id, UserRole.role_code == Role.code))
+                .scalar_subquery()
+                .label("user_count"),
+            ).where(Role.id == role_id)
         )
-        user_count = user_count_result.scalar()
+        row = result.one_or_none()
         
+        if not row:
+            raise NotFoundError("Role", role_id)
+        
+        role, user_count = row
+        
+        # 检查是否有用户使用该角色
         if user_count > 0:
             raise ValidationError(f"角色 '{role.name}' 正在被 {user_count} 个用户使用，无法删除")
         
         await self.db.delete(role)
-        await self.db.flush()
-        
+        await self.db.commit()
+        await self._invalidate_role_cache()
         logger.info(f"Role deleted: {role.code}")
         return True
 
@@ -477,7 +956,7 @@ class OrgService:
         if status is not None:
             conditions.append(Org.status == status)
         
-        stmt = select(Org).order_by(Org.id)
+        stmt = select(Org).options(raiseload("*")).order_by(Org.id)
         if conditions:
             stmt = stmt.where(*conditions)
         
@@ -499,10 +978,7 @@ class OrgService:
     async def create_org(self, code: str, name: str, type: str, parent_id: int = 0) -> Org:
         """创建组织"""
         # 检查编码是否存在
-        existing = await self.db.execute(
-            select(Org).where(Org.code == code)
-        )
-        if existing.scalar_one_or_none():
+        if await self.db.scalar(select(exists().where(Org.code == code))):
             raise ConflictError(f"Org code '{code}' already exists")
         
         org = Org(code=code, name=name, type=type, parent_id=parent_id)
@@ -532,23 +1008,33 @@ class OrgService:
     
     async def delete_org(self, org_id: int) -> bool:
         """删除组织"""
-        org = await self.get_org(org_id)
-        
-        # 检查是否有子组织
-        children_result = await self.db.execute(
-            select(func.count(Org.id)).where(Org.parent_id == org_id)
+        # 组织与子组织数、用户数一次查询取回
+        child = aliased(Org)
+        result = await self.db.execute(
+            select(
+                Org,
+                select(func.count(child.id))
+                .where(child.parent_id == Org.id)
+                .scalar_subquery()
+                .label("children_count"),
+                select(func.count(User.id))
+                .where(User.org_id == Org.id)
+                .scalar_subquery()
+                .label("user_count"),
+            ).where(Org.id == org_id)
         )
-        children_count = children_result.scalar()
+        row = result.one_or_none()
+        
+        if not row:
+            raise NotFoundError("Org", org_id)
         
+        org, children_count, user_count = row
+        
+        # 检查是否有子组织
         if children_count > 0:
             raise ValidationError(f"组织 '{org.name}' 存在 {children_count} 个子组织，无法删除")
         
         # 检查是否有用户
-        user_count_result = await self.db.execute(
-            select(func.count(User.id)).where(User.org_id == org_id)
-        )
-        user_count = user_count_result.scalar()
-        
         if user_count > 0:
             raise ValidationError(f"组织 '{org.name}' 存在 {user_count} 个用户，无法删除")
         
@@ -569,8 +1055,6 @@ class AuditLogService:
                   resource_type: str, resource_id: str = None, 
                   detail: str = None, ip_address: str = None):
         """记录操作日志"""
-        from .models import AuditLog
-        
         log = AuditLog(
             user_id=user_id,
             username=username,
@@ -587,10 +1071,6 @@ class AuditLogService:
                         resource_type: str = None, start_time = None,
                         end_time = None, page: int = 1, size: int = 20):
         """查询操作日志"""
-        from .models import AuditLog
-        from erp_common.schemas.base import PageResult
-        from .schemas import AuditLogResponse
-        
         conditions = []
         if user_id:
             conditions.append(AuditLog.user_id == user_id)
@@ -603,27 +1083,34 @@ class AuditLogService:
         if end_time:
             conditions.append(AuditLog.created_at <= end_time)
         
-        # 查询总数
-        count_stmt = select(func.count(AuditLog.id))
-        if conditions:
-            count_stmt = count_stmt.where(*conditions)
-        
-        total_result = await self.db.execute(count_stmt)
-        total = total_result.scalar()
-        
-        # 查询数据
+        # 查询数据（总数通过窗口函数随分页数据一并返回）
         offset = (page - 1) * size
-        stmt = select(AuditLog).order_by(AuditLog.created_at.desc())
+        # 日志表的列与 AuditLogResponse 字段一一对应，直接按行构建响应（跳过校验）
+        stmt = (
+            select(AuditLog.__table__, func.count().over().label("total"))
+            .order_by(AuditLog.created_at.desc())
+        )
         if conditions:
             stmt = stmt.where(*conditions)
         stmt = stmt.offset(offset).limit(size)
         
-        result = await self.db.execute(stmt)
-        logs = result.scalars().all()
-        
-        return PageResult(
-            items=[AuditLogResponse.model_validate(log) for log in logs],
-            total=total,
+        rows = (await self.db.execute(stmt)).mappings().all()
+        
+        if rows:
+            total = rows[0]["total"]
+        elif page > 1:
+            # 页码超出范围时窗口函数无结果，单独统计总数
+            count_stmt = select(func.count(AuditLog.id))
+            if conditions:
+                count_stmt = count_stmt.where(*conditions)
+            total = await self.db.scalar(count_stmt)
+        else:
+            total = 0
+        
+        # model_construct 会忽略模型外的字段（total），无需逐行剔除；分页结果同样直接构建
+        return PageResult.model_construct(
+            items=[AuditLogResponse.model_construct(**row) for row in rows],
+            total=total or 0,
             page=page,
             size=size
         )
@@ -632,8 +1119,9 @@ class AuditLogService:
 class PermissionService:
     """权限服务"""
     
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, redis: Optional[RedisClient] = None):
         self.db = db
+        self.redis = redis
     
     async def get_user_permissions(self, user_id: int) -> set[str]:
         """
@@ -647,37 +1135,48 @@ class PermissionService:
         Returns:
             权限编码集合
         """
-        # 查询用户的角色
-        role_stmt = select(UserRole.role_code).where(UserRole.user_id == user_id)
-        role_result = await self.db.execute(role_stmt)
-        role_codes = [r[0] for r in role_result.fetchall()]
-        
-        if not role_codes:
-            return set()
-        
-        # 查询角色ID
-        role_id_stmt = select(Role.id).where(Role.code.in_(role_codes))
-        role_id_result = await self.db.execute(role_id_stmt)
-        role_ids = [r[0] for r in role_id_result.fetchall()]
-        
-        if not role_ids:
-            return set()
-        
-        # 查询角色关联的权限
+        # 用户角色关联直接带角色ID，一次关联查询得到权限
         perm_stmt = (
             select(Permission.code)
             .join(RolePermission, Permission.id == RolePermission.permission_id)
-            .where(RolePermission.role_id.in_(role_ids))
+            .join(UserRole, UserRole.role_id == RolePermission.role_id)
+            .where(UserRole.user_id == user_id)
         )
         perm_result = await self.db.execute(perm_stmt)
         permissions = {r[0] for r in perm_result.fetchall()}
         
         return permissions
     
-    async def list_permissions(self) -> List[Permission]:
-        """获取所有权限点"""
+    async def list_permissions(self) -> List[PermissionResponse]:
+        """获取所有权限点（优先读取 Redis 缓存，Redis 不可用时直接查库）"""
+        cached = await cache_get(self.redis, PERMISSION_LIST_CACHE_KEY)
+        if cached:
+            return PERMISSION_LIST_ADAPTER.validate_json(cached)
+        
         result = await self.db.execute(select(Permission).order_by(Permission.code))
-        return result.scalars().all()
+        permissions = PERMISSION_LIST_ADAPTER.validate_python(
+            result.scalars().all(), from_attributes=True
+        )
+        
+        await cache_set(
+            self.redis,
+            PERMISSION_LIST_CACHE_KEY,
+            PERMISSION_LIST_ADAPTER.dump_json(permissions).decode(),
+            expire=LOOKUP_CACHE_TTL
+        )
+        return permissions
+    
+    async def list_permission_codes(self) -> Tuple[str, ...]:
+        """全部权限编码（ADMIN 的权限），进程内缓存 LOOKUP_CACHE_TTL 秒"""
+        global _admin_permission_codes
+        if _admin_permission_codes is not None:
+            codes, expires_at = _admin_permission_codes
+            if time.monotonic() < expires_at:
+                return codes
+        
+        codes = tuple(p.code for p in await self.list_permissions())
+        _admin_permission_codes = (codes, time.monotonic() + LOOKUP_CACHE_TTL)
+        return codes
     
     async def get_role_permissions(self, role_id: int) -> List[Permission]:
         """获取角色的权限点"""
@@ -697,23 +1196,22 @@ class PermissionService:
             role_id: 角色ID
             permission_codes: 权限编码列表
         """
+        global _admin_permission_codes
+        
         # 删除现有权限
         await self.db.execute(
             delete(RolePermission).where(RolePermission.role_id == role_id)
         )
         
-        if not permission_codes:
-            await self.db.commit()
-            return
-        
-        # 查询权限ID
-        perm_stmt = select(Permission).where(Permission.code.in_(permission_codes))
-        perm_result = await self.db.execute(perm_stmt)
-        permissions = perm_result.scalars().all()
-        
-        # 添加新权限
-        for perm in permissions:
-            role_perm = RolePermission(role_id=role_id, permission_id=perm.id)
-            self.db.add(role_perm)
+        # 编码解析与插入合并为一条 INSERT ... SELECT，与权限数量无关只需一次往返
+        if permission_codes:
+            await self.db.execute(
+                insert(RolePermission).from_select(
+                    ["role_id", "permission_id"],
+                    select(literal(role_id), Permission.id)
+                    .where(Permission.code.in_(permission_codes)),
+                )
+            )
         
         await self.db.commit()
+        _admin_permission_codes = None
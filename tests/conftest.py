@@ -0,0 +1,23 @@
+"""测试公共夹具：内存 SQLite 异步引擎"""
+import pytest
+from sqlalchemy import BigInteger
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+
+@compiles(BigInteger, "sqlite")
+def _bigint_as_integer(type_, compiler, **kw):
+    """SQLite 只有 INTEGER PRIMARY KEY 才自增"""
+    return "INTEGER"
+
+
+@pytest.fixture
+async def db_engine():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    yield engine
+    await engine.dispose()
@@ -0,0 +1,26 @@
+"""Kafka 消息序列化测试"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from erp_common.utils.kafka_utils import serialize_value
+
+
+def test_serialize_value_keeps_json_default_str_format():
+    """消息格式与原 json.dumps(default=str) 一致（日期时间以空格分隔）"""
+    value = {
+        "created_at": datetime(2024, 1, 1, 12, 0, 0),
+        "biz_date": date(2024, 1, 2),
+        "amount": Decimal("1.50"),
+        "remark": "入库",
+        "operator": None,
+    }
+    
+    payload = json.loads(serialize_value(value))
+    
+    assert payload == json.loads(json.dumps(value, default=str))
+    assert payload["created_at"] == "2024-01-01 12:00:00"
+
+
+def test_serialize_value_passes_bytes_through():
+    assert serialize_value(b'{"a":1}') == b'{"a":1}'
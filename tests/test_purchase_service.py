@@ -0,0 +1,35 @@
+"""采购中心 - 供应商缓存测试"""
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from erp_common.database import Base
+from services.purchase_service.models import PoDetail, PoOrder, Supplier
+from services.purchase_service.service import SupplierService
+
+
+class DownRedis:
+    """所有操作都抛出连接错误的 Redis"""
+    
+    async def _fail(self, *args, **kwargs):
+        raise RedisConnectionError("Connection refused")
+    
+    get_json = set_json = delete = _fail
+
+
+@pytest.fixture
+async def db(db_engine):
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[model.__table__ for model in (Supplier, PoOrder, PoDetail)])
+    async with async_sessionmaker(db_engine, expire_on_commit=False)() as session:
+        yield session
+
+
+async def test_get_cached_reads_database_when_redis_down(db):
+    supplier = Supplier(code="S001", name="供应商一")
+    db.add(supplier)
+    await db.flush()
+    
+    response = await SupplierService(db, DownRedis()).get_cached(supplier.id)
+    
+    assert (response.code, response.name) == ("S001", "供应商一")
@@ -0,0 +1,207 @@
+"""库存中心 - 出入库数量与成本计算测试"""
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from erp_common.database import Base
+from erp_common.exceptions import BusinessException
+from services.stock_service.models import Stock, StockDetail, StockLock, StockMove
+from services.stock_service.schemas import (
+    SourceType, StockInItem, StockInRequest, StockLockItem, StockLockRequest,
+    StockOutItem, StockOutRequest, StockUnlockRequest,
+)
+from services.stock_service.service import (
+    StockService, allocate_fifo, weighted_avg_cost,
+)
+
+WAREHOUSE_ID = 1
+STOCK_TABLES = [model.__table__ for model in (Stock, StockDetail, StockMove, StockLock)]
+
+
+@pytest.fixture
+async def db(db_engine):
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=STOCK_TABLES)
+    async with async_sessionmaker(db_engine, expire_on_commit=False)() as session:
+        yield session
+
+
+@pytest.fixture
+def service(db):
+    return StockService(db)
+
+
+async def read_stock(db, sku_id: str) -> Stock:
+    """从数据库重新读取库存主表（绕过会话中的缓存对象）"""
+    db.expunge_all()
+    result = await db.execute(
+        select(Stock).where(Stock.sku_id == sku_id, Stock.warehouse_id == WAREHOUSE_ID)
+    )
+    return result.scalar_one()
+
+
+async def read_detail_qtys(db, sku_id: str) -> list:
+    db.expunge_all()
+    result = await db.execute(
+        select(StockDetail.qty).where(StockDetail.sku_id == sku_id).order_by(StockDetail.id)
+    )
+    return [Decimal(qty) for qty in result.scalars().all()]
+
+
+def stock_in_request(*items, order_no: str = "PO001") -> StockInRequest:
+    return StockInRequest(
+        warehouse_id=WAREHOUSE_ID,
+        source_type=SourceType.PURCHASE,
+        source_order_no=order_no,
+        items=[StockInItem(sku_id=sku_id, qty=qty, unit_cost=cost) for sku_id, qty, cost in items],
+    )
+
+
+def stock_out_request(*items, order_no: str = "SO001") -> StockOutRequest:
+    return StockOutRequest(
+        warehouse_id=WAREHOUSE_ID,
+        source_type=SourceType.SALE,
+        source_order_no=order_no,
+        items=[StockOutItem(sku_id=sku_id, qty=qty) for sku_id, qty in items],
+    )
+
+
+def lock_request(*items, order_no: str = "SO001") -> StockLockRequest:
+    return StockLockRequest(
+        warehouse_id=WAREHOUSE_ID,
+        source_order_no=order_no,
+        items=[StockLockItem(sku_id=sku_id, qty=qty) for sku_id, qty in items],
+    )
+
+
+def assert_quantities(stock: Stock, qty: str, locked_qty: str, available_qty: str):
+    assert (Decimal(stock.qty), Decimal(stock.locked_qty), Decimal(stock.available_qty)) == (
+        Decimal(qty), Decimal(locked_qty), Decimal(available_qty)
+    )
+
+
+# ============ 纯计算 ============
+
+def test_weighted_avg_cost_rounds_half_up():
+    assert weighted_avg_cost(Decimal("10"), Decimal("2"), Decimal("20"), Decimal("3.5")) == Decimal("3.0000")
+    
+    # 1/3 = 0.33333...，2/3 = 0.66666...，按 avg_cost 列的 4 位小数四舍五入
+    assert weighted_avg_cost(Decimal("1"), Decimal("1"), Decimal("2"), Decimal("0")) == Decimal("0.3333")
+    assert weighted_avg_cost(Decimal("2"), Decimal("1"), Decimal("1"), Decimal("0")) == Decimal("0.6667")
+
+
+def test_allocate_fifo_skips_locked_and_reports_shortage():
+    details = [
+        SimpleNamespace(qty=Decimal("5"), locked_qty=Decimal("5"), unit_cost=Decimal("1")),
+        SimpleNamespace(qty=Decimal("4"), locked_qty=Decimal("1"), unit_cost=Decimal("2")),
+        SimpleNamespace(qty=Decimal("10"), locked_qty=Decimal("0"), unit_cost=Decimal("3")),
+    ]
+    
+    allocations, cost, remaining = allocate_fifo(details, Decimal("5"))
+    assert allocations == [(details[1], Decimal("3")), (details[2], Decimal("2"))]
+    assert (cost, remaining) == (Decimal("12"), Decimal("0"))
+    
+    allocations, cost, remaining = allocate_fifo(details, Decimal("7"), use_locked=True)
+    assert [q for _, q in allocations] == [Decimal("5"), Decimal("2")]
+    assert (cost, remaining) == (Decimal("9"), Decimal("0"))
+    
+    _, _, remaining = allocate_fifo(details, Decimal("20"))
+    assert remaining == Decimal("7")
+
+
+# ============ 出入库 ============
+
+async def test_stock_in_applies_quantity_once_and_averages_cost(service, db):
+    await service.stock_in(stock_in_request(("SKU1", Decimal("10"), Decimal("2"))))
+    stock = await read_stock(db, "SKU1")
+    assert_quantities(stock, "10", "0", "10")
+    assert Decimal(stock.avg_cost) == Decimal("2")
+    
+    await service.stock_in(stock_in_request(("SKU1", Decimal("30"), Decimal("4")), order_no="PO002"))
+    stock = await read_stock(db, "SKU1")
+    assert_quantities(stock, "40", "0", "40")
+    assert Decimal(stock.avg_cost) == Decimal("3.5")
+
+
+async def test_stock_out_deducts_fifo_batches_once(service, db):
+    await service.stock_in(stock_in_request(("SKU1", Decimal("4"), Decimal("1"))))
+    await service.stock_in(stock_in_request(("SKU1", Decimal("6"), Decimal("2")), order_no="PO002"))
+    
+    result = await service.stock_out(stock_out_request(("SKU1", Decimal("5"))))
+    
+    assert result.total_cost == Decimal("6")
+    assert_quantities(await read_stock(db, "SKU1"), "5", "0", "5")
+    assert await read_detail_qtys(db, "SKU1") == [Decimal("0"), Decimal("5")]
+
+
+async def test_stock_out_rejects_more_than_available(service, db):
+    await service.stock_in(stock_in_request(("SKU1", Decimal("3"), Decimal("1"))))
+    
+    with pytest.raises(BusinessException) as exc_info:
+        await service.stock_out(stock_out_request(("SKU1", Decimal("4"))))
+    assert exc_info.value.code == "INSUFFICIENT_STOCK"
+
+
+async def test_stock_out_fails_when_stock_changed_concurrently(service, db, db_engine):
+    await service.stock_in(stock_in_request(("SKU1", Decimal("10"), Decimal("1"))))
+    # 持有引用，保证会话中的库存对象不被回收，后续读取到的仍是旧值
+    stocks = await service.load_stocks({("SKU1", WAREHOUSE_ID)})
+    
+    # 其他请求已扣减
+    async with async_sessionmaker(db_engine)() as other:
+        await other.execute(
+            update(Stock).where(Stock.sku_id == "SKU1").values(qty=2, available_qty=2)
+        )
+        await other.commit()
+    
+    with pytest.raises(BusinessException) as exc_info:
+        await service.stock_out(stock_out_request(("SKU1", Decimal("3"))))
+    assert exc_info.value.code == "INSUFFICIENT_STOCK"
+    assert stocks[("SKU1", WAREHOUSE_ID)].available_qty == Decimal("7")
+    
+    await db.rollback()
+    assert_quantities(await read_stock(db, "SKU1"), "2", "0", "2")
+
+
+async def test_lock_and_unlock_move_only_locked_quantity(service, db):
+    await service.stock_in(stock_in_request(("SKU1", Decimal("10"), Decimal("1"))))
+    
+    lock = await service.lock_stock(lock_request(("SKU1", Decimal("4"))))
+    assert_quantities(await read_stock(db, "SKU1"), "10", "4", "6")
+    
+    result = await service.unlock_stock(StockUnlockRequest(lock_nos=lock.lock_nos))
+    assert result.unlocked_count == 1
+    assert_quantities(await read_stock(db, "SKU1"), "10", "0", "10")
+
+
+async def test_consume_locked_stock_deducts_locked_quantity_once(service, db):
+    await service.stock_in(stock_in_request(("SKU1", Decimal("10"), Decimal("2"))))
+    await service.lock_stock(lock_request(("SKU1", Decimal("3")), order_no="SO009"))
+    
+    result = await service.consume_locked_stock("SO009")
+    
+    assert result.total_cost == Decimal("6")
+    assert_quantities(await read_stock(db, "SKU1"), "7", "0", "7")
+    assert await read_detail_qtys(db, "SKU1") == [Decimal("7")]
+
+
+class DownRedis:
+    """所有操作都抛出连接错误的 Redis"""
+    
+    async def _fail(self, *args, **kwargs):
+        raise RedisConnectionError("Connection refused")
+    
+    get = set = delete = _fail
+
+
+async def test_get_stock_info_reads_database_when_redis_down(service, db):
+    await service.stock_in(stock_in_request(("SKU1", Decimal("5"), Decimal("1"))))
+    
+    info = await StockService(db, redis=DownRedis()).get_stock_info("SKU1", WAREHOUSE_ID)
+    
+    assert Decimal(info.qty) == Decimal("5")
+    assert [Decimal(d.qty) for d in info.details] == [Decimal("5")]
@@ -0,0 +1,176 @@
+"""用户中心 - 认证与缓存测试"""
+import pytest
+from pydantic import ValidationError as PydanticValidationError
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from erp_common.database import Base
+from erp_common.exceptions import ConflictError, ValidationError
+from erp_common.utils.jwt_utils import create_access_token, pwd_context
+from services.user_service import service as user_service
+from services.user_service.models import (
+    Org, Permission, Role, RolePermission, User, UserRole,
+)
+from services.user_service.schemas import LoginRequest, UserCreate, UserUpdate
+from services.user_service.service import (
+    AuthService, PermissionService, RoleService, UserService, login_user_cache_key,
+    verify_access_token,
+)
+
+USER_TABLES = [
+    model.__table__ for model in (Org, User, Role, UserRole, Permission, RolePermission)
+]
+
+
+class DownRedis:
+    """所有操作都抛出连接错误的 Redis"""
+    
+    async def _fail(self, *args, **kwargs):
+        raise RedisConnectionError("Connection refused")
+    
+    get = set = delete = _fail
+
+
+class RecordingRedis:
+    """记录删除键时会话是否仍有未提交的事务"""
+    
+    def __init__(self, db):
+        self.db = db
+        self.deleted = []
+    
+    async def delete(self, *keys):
+        self.deleted.append((keys, self.db.in_transaction()))
+
+
+@pytest.fixture
+async def db(db_engine):
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=USER_TABLES)
+    async with async_sessionmaker(db_engine, expire_on_commit=False)() as session:
+        yield session
+
+
+async def test_verify_access_token_falls_back_to_decode_when_redis_down():
+    token = create_access_token(user_id=7, username="alice", roles=["ADMIN"])
+    
+    token_data = await verify_access_token(token, DownRedis())
+    
+    assert (token_data.user_id, token_data.username, token_data.roles) == (7, "alice", ["ADMIN"])
+    assert await verify_access_token("not-a-token", DownRedis()) is None
+
+
+async def test_login_reads_database_when_redis_down(db, monkeypatch):
+    # 本地未安装 argon2，测试用 bcrypt 哈希且不触发重算
+    monkeypatch.setattr(user_service, "password_needs_rehash", lambda hashed: False)
+    user = User(username="alice", password=pwd_context.hash("secret123", scheme="bcrypt"), name="Alice")
+    db.add(user)
+    await db.flush()
+    db.add(UserRole(user_id=user.id, role_code="ADMIN"))
+    await db.commit()
+    
+    response = await AuthService(db, DownRedis()).login(
+        LoginRequest(username="alice", password="secret123")
+    )
+    
+    assert response.user.username == "alice"
+    assert response.user.roles == ["ADMIN"]
+
+
+async def add_user(db, username: str, *role_codes: str) -> User:
+    """直接写入用户和按编码分配的角色（role_id 为空，模拟角色尚未创建时的分配）"""
+    user = User(username=username, password="x")
+    db.add(user)
+    await db.flush()
+    db.add_all(UserRole(user_id=user.id, role_code=code) for code in role_codes)
+    await db.flush()
+    return user
+
+
+async def test_create_role_grants_permissions_to_users_assigned_before(db):
+    user = await add_user(db, "bob", "AUDITOR")
+    permission = Permission(code="audit:read", name="查看日志")
+    db.add(permission)
+    
+    role = await RoleService(db).create_role("AUDITOR", "审计员")
+    db.add(RolePermission(role_id=role.id, permission_id=permission.id))
+    await db.flush()
+    
+    assert await PermissionService(db).get_user_permissions(user.id) == {"audit:read"}
+
+
+async def test_delete_role_refuses_role_still_assigned_by_code(db):
+    role = Role(code="AUDITOR", name="审计员")
+    db.add(role)
+    await add_user(db, "bob", "AUDITOR")
+    
+    with pytest.raises(ValidationError):
+        await RoleService(db).delete_role(role.id)
+
+
+def test_blank_email_is_treated_as_not_provided():
+    # 管理端表单未填邮箱时提交空字符串
+    assert UserCreate(username="bob", password="secret123", email="").email is None
+    assert UserUpdate(email="").email is None
+    assert UserUpdate(email="bob@example.com").email == "bob@example.com"
+    with pytest.raises(PydanticValidationError):
+        UserUpdate(email="not-an-email")
+
+
+async def test_login_cache_is_invalidated_after_commit(db, monkeypatch):
+    async def fake_hash(password):
+        return "hashed:" + password
+    monkeypatch.setattr(user_service, "hash_password", fake_hash)
+    user = await add_user(db, "bob")
+    await db.commit()
+    redis = RecordingRedis(db)
+    
+    await UserService(db, redis=redis).reset_password(user.id, "newpass123")
+    
+    assert redis.deleted == [((login_user_cache_key("bob"),), False)]
+
+
+async def test_create_user_maps_only_username_conflicts(db, db_engine, monkeypatch):
+    async def hash_while_racing(password):
+        # 计算哈希期间另一个请求创建了同名用户
+        async with async_sessionmaker(db_engine)() as other:
+            await add_user(other, "bob")
+            await other.commit()
+        return "hashed:" + password
+    monkeypatch.setattr(user_service, "hash_password", hash_while_racing)
+    
+    with pytest.raises(ConflictError):
+        await UserService(db).create_user(UserCreate(username="bob", password="secret123"))
+    
+    async def broken_hash(password):
+        return None
+    monkeypatch.setattr(user_service, "hash_password", broken_hash)
+    
+    with pytest.raises(IntegrityError):
+        await UserService(db).create_user(UserCreate(username="carol", password="secret123"))
+
+
+async def test_role_mutations_commit_before_invalidating_cache(db):
+    redis = RecordingRedis(db)
+    service = RoleService(db, redis)
+    
+    role = await service.create_role("AUDITOR", "审计员")
+    await service.update_role(role.id, name="审计")
+    await service.delete_role(role.id)
+    
+    assert [in_transaction for _, in_transaction in redis.deleted] == [False, False, False]
+    
+    # 未配置缓存时事务边界不变
+    await RoleService(db).create_role("CLERK", "文员")
+    assert not db.in_transaction()
+
+
+async def test_role_and_permission_lists_read_database_when_redis_down(db):
+    db.add_all([Role(code="ADMIN", name="管理员"), Permission(code="user:read", name="查看用户")])
+    await db.flush()
+    
+    roles = await RoleService(db, DownRedis()).list_roles()
+    permissions = await PermissionService(db, DownRedis()).list_permissions()
+    
+    assert [role.code for role in roles] == ["ADMIN"]
+    assert [permission.code for permission in permissions] == ["user:read"]